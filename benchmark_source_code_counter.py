@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+#
+# benchmark_source_code_counter.py
+#
+# Date    : 2026-10-17
+# Author  : Hirotoshi FUJIBE
+# History :
+#
+# Copyright (c) 2024 Hirotoshi FUJIBE
+#
+
+"""
+Usage:
+
+    Python.exe benchmark_source_code_counter.py [-f FILES] [-l LINES] [-s SEED] [-r REPEAT]
+                                                [-o RESULT] [-b BASELINE] [-k]
+
+Options:
+
+    -h
+    --help
+        Print this message and exit.
+
+    -f FILES
+    --files=FILES
+        Number of files per language in the synthetic corpus (default: 40).
+
+    -l LINES
+    --lines=LINES
+        Number of lines per file (default: 2000).
+
+    -s SEED
+    --seed=SEED
+        Seed of the corpus generator (default: 1).
+
+    -r REPEAT
+    --repeat=REPEAT
+        Number of runs of each benchmark, the best one is reported (default: 3).
+
+    -o RESULT
+    --output=RESULT
+        Store the results to a JSON file (default: .\\output\\benchmark.json).
+
+    -b BASELINE
+    --baseline=BASELINE
+        Compare the results with a JSON file stored by an earlier run.
+
+    -k
+    --keep
+        Keep the corpus directory.
+"""
+
+# Import Libraries
+import os
+import sys
+import json
+import time
+import random
+import getopt
+import shutil
+import datetime
+import tempfile
+import platform
+import contextlib
+import io
+import subprocess
+import source_code_counter as scc
+
+# Input, Output
+IN_DIR_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+IN_EXCEL = os.path.join(IN_DIR_SCRIPT, 'input', 'source_code_counter_list_template.xlsx')
+IN_SCRIPT = os.path.join(IN_DIR_SCRIPT, 'source_code_counter.py')
+OUT_RESULT = os.path.join('.', 'output', 'benchmark.json')
+
+# Corpus
+CORPUS_FILES = 40
+CORPUS_LINES = 2000
+CORPUS_SEED = 1
+REPEAT = 3
+EXCEL_ROWS = 20000
+
+# Words for Synthetic Source Code ('日本語' and '中文' need an encoding other than ASCII)
+WORDS = ['value', 'count', 'index', 'name', 'result', 'buffer', 'node', 'item', 'data', 'size']
+WORDS_NON_ASCII = {'utf-8': '日本語と中文', 'shift-jis': '日本語', 'gb2312': '中文'}
+
+
+# Generate Python Lines (many triple-quoted docstrings)
+def gen_python(rnd: random.Random, num_lines: int, text: str) -> list:
+
+    lines = []
+    while len(lines) < num_lines:
+        name = rnd.choice(WORDS)
+        lines.append('def %s_%d(%s, %s=None):' % (name, len(lines), rnd.choice(WORDS), rnd.choice(WORDS)))
+        lines.append('    """')
+        for _ in range(rnd.randint(1, 6)):
+            lines.append('    %s %s "%s" %s' % (text, rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(WORDS)))
+        lines.append('    """')
+        for _ in range(rnd.randint(2, 10)):
+            kind = rnd.random()
+            if kind < 0.2:
+                lines.append('    # %s %s' % (rnd.choice(WORDS), text))
+            elif kind < 0.4:
+                lines.append("    %s = '%s\\'s %s'  # %s" %
+                             (rnd.choice(WORDS), text, rnd.choice(WORDS), rnd.choice(WORDS)))
+            elif kind < 0.5:
+                lines.append('')
+            else:
+                lines.append('    %s = %s(%s) + %d' %
+                             (rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(WORDS), len(lines)))
+        lines.append('    return %s' % rnd.choice(WORDS))
+        lines.append('')
+    return lines[:num_lines]
+
+
+# Generate Java/C Lines (nested looking block comments)
+def gen_java(rnd: random.Random, num_lines: int, text: str) -> list:
+
+    lines = []
+    while len(lines) < num_lines:
+        lines.append('/*')
+        lines.append(' * %s /* %s */ %s' % (text, rnd.choice(WORDS), rnd.choice(WORDS)))
+        lines.append(' */')
+        lines.append('public int %s%d(int %s) {' % (rnd.choice(WORDS), len(lines), rnd.choice(WORDS)))
+        for _ in range(rnd.randint(2, 12)):
+            kind = rnd.random()
+            if kind < 0.2:
+                lines.append('\t// %s %s' % (rnd.choice(WORDS), text))
+            elif kind < 0.35:
+                lines.append('\tString %s = "%s \\"%s\\" //";' % (rnd.choice(WORDS), text, rnd.choice(WORDS)))
+            elif kind < 0.45:
+                lines.append('\t/* %s */ %s++; /* %s' % (rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(WORDS)))
+                lines.append('\t   %s */' % text)
+            elif kind < 0.5:
+                lines.append('')
+            else:
+                lines.append('\t%s = %s * %d / (%s + 1);' %
+                             (rnd.choice(WORDS), rnd.choice(WORDS), len(lines), rnd.choice(WORDS)))
+        lines.append('}')
+    return lines[:num_lines]
+
+
+# Generate SQL Lines ('--' comments and '' escapes)
+def gen_sql(rnd: random.Random, num_lines: int, text: str) -> list:
+
+    lines = []
+    while len(lines) < num_lines:
+        lines.append('-- %s %s' % (text, rnd.choice(WORDS)))
+        lines.append('SELECT %s, %s  -- %s' % (rnd.choice(WORDS), rnd.choice(WORDS), rnd.choice(WORDS)))
+        lines.append('  FROM %s' % rnd.choice(WORDS))
+        lines.append(" WHERE %s = '%s''s %s'" % (rnd.choice(WORDS), text, rnd.choice(WORDS)))
+        lines.append('/* %s */' % rnd.choice(WORDS))
+        lines.append("INSERT INTO %s VALUES (%d, 'it''s', \"%s\");" % (rnd.choice(WORDS), len(lines), text))
+        lines.append('')
+    return lines[:num_lines]
+
+
+# Generate Text Lines
+def gen_text(rnd: random.Random, num_lines: int, text: str) -> list:
+    return [' '.join([text] + [rnd.choice(WORDS) for _ in range(rnd.randint(0, 12))]) for _ in range(num_lines)]
+
+
+GENERATORS = [
+    ('python', '.py', gen_python, scc.scan_python_file),
+    ('java', '.java', gen_java, scc.scan_java_file),
+    ('sql', '.sql', gen_sql, scc.scan_sql_file),
+    ('text', '.txt', gen_text, None),
+]
+
+
+# Generate Corpus
+def gen_corpus(dir_root: str, num_files: int, num_lines: int, seed: int) -> dict:
+
+    rnd = random.Random(seed)
+    corpus = {}
+    for name, ext, generator, scanner in GENERATORS:
+        dir_lang = os.path.join(dir_root, name)
+        os.makedirs(dir_lang)
+        files = []
+        for i in range(num_files):
+            enc = scc.ENCODINGS[i % len(scc.ENCODINGS)]
+            lines = generator(rnd, num_lines, WORDS_NON_ASCII[enc])
+            full_path_file = os.path.join(dir_lang, '%s_%03d%s' % (name, i, ext))
+            with open(full_path_file, 'w', encoding=enc, newline='\n') as file:
+                file.write('\n'.join(lines) + '\n')
+            files.append(full_path_file)
+        corpus[name] = files
+    return corpus
+
+
+# Measure (best of repeat)
+def measure(func, repeat: int) -> float:
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Run Benchmarks
+def run_benchmarks(dir_root: str, corpus: dict, repeat: int) -> dict:
+
+    results = {}
+
+    def add(key: str, seconds: float, num_files: int, num_bytes: int) -> None:
+        results[key] = {
+            'seconds': round(seconds, 6),
+            'files': num_files,
+            'bytes': num_bytes,
+            'mb_per_sec': round(num_bytes / seconds / 1e6, 3) if seconds > 0 else None,
+            'files_per_sec': round(num_files / seconds, 1) if seconds > 0 else None,
+        }
+        return
+
+    # Scanners (count only, and with tokens for the debug file)
+    for name, ext, generator, scanner in GENERATORS:
+        files = corpus[name]
+        num_bytes = sum(os.path.getsize(file) for file in files)
+        if scanner is None:
+            add('scan_text_file', measure(lambda: [scc.scan_text_file(file) for file in files], repeat),
+                len(files), num_bytes)
+            continue
+        add(scanner.__name__, measure(lambda: [scanner(file, None) for file in files], repeat),
+            len(files), num_bytes)
+        add(scanner.__name__ + '[tokens]', measure(lambda: [scanner(file, io.StringIO()) for file in files], repeat),
+            len(files), num_bytes)
+
+    # Directory Walk
+    num_files = sum(len(files) for files in corpus.values())
+    add('walk_directories', measure(lambda: list(scc.walk_directories(dir_root, os.sep)), repeat), num_files, 0)
+
+    # Excel Writer
+    def write_excel() -> None:
+        writer = scc.WriteExcel(IN_EXCEL, os.path.join(dir_root, 'benchmark.xlsx'), scc.OUT_SHEET)
+        for start in range(1, EXCEL_ROWS + 1, scc.PIPELINE_BATCH):
+            writer.write_rows([scc.FileResult(no, no // 2, scc.MSG_NORMAL, 'utf-8',
+                                              (no // 4, no - no // 4 - no // 2, no // 2, 0)).set_row(
+                no, os.sep + 'dir%d' % (no // 100), 'file%d.py' % no)
+                for no in range(start, min(start + scc.PIPELINE_BATCH, EXCEL_ROWS + 1))])
+        writer.close()
+        return
+    add('WriteExcel', measure(write_excel, repeat), EXCEL_ROWS, 0)
+
+    # Startup (a new interpreter for each run, as the command line is called)
+    def run_command(args: list) -> None:
+        subprocess.run([sys.executable] + args, cwd=dir_root, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    add('startup:import', measure(lambda: run_command(
+        ['-c', 'import sys; sys.path.insert(0, %r); import source_code_counter' % IN_DIR_SCRIPT]), repeat), 1, 0)
+    add('startup:help', measure(lambda: run_command([IN_SCRIPT, '-h']), repeat), 1, 0)
+    num_files = len(corpus['sql'])
+    add('startup:csv', measure(lambda: run_command(
+        [IN_SCRIPT, '-i', os.path.join(dir_root, 'sql'), '-o', 'csv', '--output-dir', os.path.join(dir_root, 'out')]),
+        repeat), num_files, sum(os.path.getsize(file) for file in corpus['sql']))
+
+    return results
+
+
+# Print Results
+def print_results(results: dict, baseline: dict) -> None:
+
+    print('%-28s %10s %10s %12s %8s' % ('benchmark', 'seconds', 'MB/s', 'files(rows)/s', 'change'))
+    for key, result in results.items():
+        change = ''
+        if baseline is not None and key in baseline and baseline[key]['seconds']:
+            change = '%+.1f%%' % ((result['seconds'] / baseline[key]['seconds'] - 1.0) * 100.0)
+        print('%-28s %10.3f %10s %12s %8s' %
+              (key, result['seconds'],
+               '%.2f' % result['mb_per_sec'] if result['bytes'] and result['mb_per_sec'] is not None else '-',
+               '%.1f' % result['files_per_sec'] if result['files_per_sec'] is not None else '-',
+               change))
+    return
+
+
+# Main
+def main() -> None:
+
+    try:
+        options, arguments = getopt.getopt(sys.argv[1:], shortopts="hf:l:s:r:o:b:k",
+                                           longopts=["help", "files=", "lines=", "seed=", "repeat=",
+                                                     "output=", "baseline=", "keep"])
+    except getopt.error as message:
+        print(message)
+        print(__doc__)
+        sys.exit(1)
+
+    num_files = CORPUS_FILES
+    num_lines = CORPUS_LINES
+    seed = CORPUS_SEED
+    repeat = REPEAT
+    out_result = OUT_RESULT
+    in_baseline = None
+    is_keep = False
+    for option, argument in options:
+        if option in ("-h", "--help"):
+            print(__doc__)
+            sys.exit(0)
+        elif option in ("-f", "--files", "-l", "--lines", "-s", "--seed", "-r", "--repeat"):
+            if not argument.isdigit():
+                print('option %s requires a number' % option)
+                print(__doc__)
+                sys.exit(1)
+            if option in ("-f", "--files"):
+                num_files = int(argument)
+            elif option in ("-l", "--lines"):
+                num_lines = int(argument)
+            elif option in ("-s", "--seed"):
+                seed = int(argument)
+            else:
+                repeat = max(1, int(argument))
+        elif option in ("-o", "--output"):
+            out_result = argument
+        elif option in ("-b", "--baseline"):
+            in_baseline = argument
+        elif option in ("-k", "--keep"):
+            is_keep = True
+
+    baseline = None
+    if in_baseline is not None:
+        with open(in_baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+
+    dir_root = tempfile.mkdtemp(prefix='source_code_counter_benchmark_')
+    try:
+        corpus = gen_corpus(dir_root, num_files, num_lines, seed)
+        results = run_benchmarks(dir_root, corpus, repeat)
+    finally:
+        if is_keep:
+            print('corpus is kept in %s' % dir_root)
+        else:
+            shutil.rmtree(dir_root, ignore_errors=True)
+
+    print_results(results, baseline)
+
+    with open(out_result, 'w', encoding='utf-8') as file:
+        json.dump({
+            'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'corpus': {'files': num_files, 'lines': num_lines, 'seed': seed},
+            'repeat': repeat,
+            'results': results,
+        }, file, indent=2)
+
+    sys.exit(0)
+
+
+# Goto Main
+if __name__ == '__main__':
+    main()
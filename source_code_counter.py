@@ -13,38 +13,309 @@
 """
 Usage:
 
-    Python.exe source_code_counter.py
+    Python.exe source_code_counter.py [-f CONFIG] [-i DIR ...] [--output-dir=DIR] [--template=FILE]
+                                      [--map=MAPPING] [--ignore=EXTENSIONS] [-x PATTERNS] [--gitignore]
+                                      [-j N] [-r N] [-c] [-u] [-s] [-o FORMATS] [-d] [--debug-files=PATTERNS]
+                                      [-p] [--profile-top=N] [--profile-stats]
+                                      [--save-baseline] [-g] [--git-base=REV]
+                                      [-w] [--watch-interval=SECONDS] [--compare-python]
 
 Options:
 
     -h
     --help
         Print this message and exit.
+
+    -f CONFIG
+    --config=CONFIG
+        Read the settings from an INI file. The options below override it.
+            [source_code_counter]
+            input = ./input/src
+                    ../other/src
+            output_dir = ./output
+            template = ./input/source_code_counter_list_template.xlsx
+            output = excel,csv
+            ignore = .dat,.ini
+            exclude = build/,node_modules/
+            gitignore = yes
+            [extensions]
+            .h = java
+            .pyw = python
+        Relative paths are relative to the current folder.
+
+    -i DIR
+    --input=DIR
+        Source folder to scan (default: ./input/src). It may be given more
+        than once, then all folders are written to the same outputs in one
+        run. The path column starts with the name of the folder, and with as
+        many parent folders as needed when the names are the same (e.g.
+        /a/src and /b/src).
+
+    --output-dir=DIR
+        Folder of all output files (default: ./output).
+
+    --template=FILE
+        Excel template (default: ./input/source_code_counter_list_template.xlsx).
+
+    --map=MAPPING
+        Comma separated extension to scanner mappings, e.g. '.h:java,.pyw:python'.
+        Scanners are python, python-tokenize, java (also C and C++), sql,
+        csharp, javascript (also TypeScript), go, shell, xml (also HTML), text
+        and ignore. python-tokenize classifies the lines of Python with the
+        tokenize module (docstrings, which may be in ''' or prefixed, are not
+        steps), e.g. '.py:python-tokenize'.
+
+    --ignore=EXTENSIONS
+        Comma separated extensions to ignore, added to .dat and .ini. The
+        ignored files are listed without lines and steps.
+
+    -x PATTERNS
+    --exclude=PATTERNS
+        Comma separated patterns of files and directories to exclude, in the
+        syntax of .gitignore relative to the source folder, e.g.
+        'build/,node_modules/,*.min.js,!keep.min.js'. The excluded files are
+        not listed, and the excluded directories are not walked at all.
+        They take precedence over .gitignore files.
+
+    --gitignore
+        Also exclude the files ignored by the .gitignore files of the source
+        folder, its sub directories and its parents up to the top of the git
+        repository, and by .git/info/exclude. The .git directory is excluded.
+
+    -j N
+    --jobs=N
+        Scan files with N worker processes (default: 1, 0: number of CPUs).
+        Rows are written in the same order as a serial run.
+
+    -r N
+    --readers=N
+        Read files with N threads ahead of the scanner (default: 4). More
+        threads hide the latency of network file systems and cold caches.
+
+    -c
+    --cache
+        Reuse the results of the previous run from the cache file in the
+        output folder. Files whose size and modified time, or whose content
+        hash, are unchanged are not scanned again, unless --map, --ignore or
+        the [extensions] of the config give them another scanner now. The
+        cache is not read while the debug file is written.
+
+    -u
+    --dedup
+        Scan files of the same extension and the same content only once, and
+        reuse the result for the other copies. The whole tree is walked
+        first to find them by size. The duplicate groups and the
+        duplicated lines and steps are printed, and written to the
+        Duplicates sheet of the Excel output. Copies are looked for within
+        each source folder.
+
+    -s
+    --summary
+        Total files, lines and steps per directory (including its sub
+        directories), per extension and per scanner while scanning. The
+        totals are written to the Directories, Extensions and Scanners sheets
+        of the Excel output, and the totals per scanner are printed.
+
+    -o FORMATS
+    --output=FORMATS
+        Comma separated output formats (default: excel).
+            excel    : source_code_counter_list.xlsx
+            csv      : source_code_counter_list.csv
+            jsonl    : source_code_counter_list.jsonl (JSON Lines)
+            columnar : source_code_counter_list.bin (columnar binary)
+        Every output has the lines and steps of each file, and its lines by
+        class, counted in the same pass as the steps: blank, comment (lines
+        without code, e.g. comments and docstrings), code (code only) and
+        mixed (code and a comment). Code and mixed add up to the steps, and
+        all four to the lines. The classes are empty for text files.
+
+    -d
+    --debug-tokens
+        Write the tokens of every line to debug.txt (default: off).
+
+    --debug-files=PATTERNS
+        Comma separated glob patterns, matched against the file name and the
+        relative path (with '/'), e.g. '*.sql,src/py/*'. Only the tokens of
+        matched files are written. It implies --debug-tokens.
+
+    -p
+    --profile
+        Write wall time and CPU time of each phase (directory walk, encoding
+        detection, tokenizing per language, output writing) and the slowest
+        files to profile.json. The CPU time of a phase is that of the thread
+        which runs it.
+
+    --profile-top=N
+        Number of the slowest files in profile.json (default: 20).
+        It implies --profile.
+
+    --profile-stats
+        Also dump cProfile statistics of the main process to profile.pstats.
+        It implies --profile.
+
+    --save-baseline
+        Store the result of every file to baseline.json in the output folder,
+        with the git revision of the source folder (if it is in a git
+        repository), as the baseline of the git mode.
+
+    -g
+    --git
+        Scan only the files added, modified, renamed or deleted since the
+        revision of the baseline (git diff --name-status against the working
+        tree, so untracked files are not seen). The rows of the other files
+        are taken from the baseline, the changes are written to the Delta
+        sheet of the Excel output and printed, and the baseline is updated.
+        Changed files whose results are the same as in the baseline are not
+        listed. The files which differ from the revision when the baseline
+        is saved are kept in the baseline, and scanned again by the next run
+        even if they are reverted. -j, -r, -c and -u are not used in this
+        mode, and only one source folder is allowed. Give the same -x and
+        --gitignore as --save-baseline.
+
+    --git-base=REV
+        Same as --git, but against the revision REV instead of the revision
+        of the baseline.
+
+    -w
+    --watch
+        Keep running, and keep the result of every file in memory. The source
+        folders are polled (the size and modified time of every file), only
+        the added and modified files are scanned again, and the outputs are
+        rewritten and the totals printed after each change. Stop it with
+        Ctrl+C. -j is used to scan, -r, -c, -u, -d, -p and -g are not used in
+        this mode.
+
+    --watch-interval=SECONDS
+        Seconds between polls (default: 1). It implies --watch.
+
+    --compare-python
+        Scan the Python files with both python and python-tokenize, print the
+        files whose steps differ, with the comment, docstring and blank lines
+        by python-tokenize, and exit. No output file is written.
 """
 
 # Import Libraries
 import os
+import re
 import sys
 import getopt
-import shutil
 import datetime
-import openpyxl
+import io
+import csv
+import copy
+import json
+import array
+import codecs
+import struct
+import zlib
+import mmap
+import fnmatch
+import time
+import heapq
+import cProfile
+import hashlib
+import tokenize
+import sqlite3
+import signal
+import subprocess
+import configparser
+import queue
+import threading
+import collections
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Union
-from openpyxl.styles import Font, Alignment, PatternFill
-from openpyxl.styles.borders import Border, Side
 
-# Input, Output
-IN_DIR = '.\\input'
-OUT_DIR = '.\\output'
+# Input, Output (defaults of --input, --output-dir and --template)
+IN_DIR = os.path.join('.', 'input')
+OUT_DIR = os.path.join('.', 'output')
 # IN_SRC_ROOT = 'D:\\Developments\\PyCharmProjects\\tool-source_code_counter\\input'  # noqa
-IN_SRC_ROOT = '.\\input'
-IN_SRC_RELATIVE = '\\src'
-IN_EXCEL = IN_DIR + '\\source_code_counter_list_template.xlsx'
-OUT_EXCEL = OUT_DIR + '\\source_code_counter_list.xlsx'
+IN_SRC_ROOT = os.path.join('.', 'input')
+IN_SRC_RELATIVE = os.sep + 'src'
+IN_EXCEL = os.path.join(IN_DIR, 'source_code_counter_list_template.xlsx')
+OUT_EXCEL = os.path.join(OUT_DIR, 'source_code_counter_list.xlsx')
 OUT_SHEET = 'Source Code Counter List'
+OUT_SHEET_DUPLICATES = 'Duplicates'
+OUT_SHEET_DIRECTORIES = 'Directories'
+OUT_SHEET_EXTENSIONS = 'Extensions'
+OUT_SHEET_SCANNERS = 'Scanners'
+OUT_SHEET_DELTA = 'Delta'
 ENCODINGS = ['utf-8', 'shift-jis', 'gb2312']
+ENCODING_ASCII = 'ascii'
+ENCODING_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+ENCODING_BINARY = 'binary'
 IGNORE_EXTENDS = ['.dat', '.ini']
-OUT_DEBUG = OUT_DIR + '\\debug.txt'
+OUT_DEBUG = os.path.join(OUT_DIR, 'debug.txt')
+OUT_CSV = os.path.join(OUT_DIR, 'source_code_counter_list.csv')
+OUT_JSONL = os.path.join(OUT_DIR, 'source_code_counter_list.jsonl')
+OUT_COLUMNAR = os.path.join(OUT_DIR, 'source_code_counter_list.bin')
+
+# Line Metrics (numbers of blank, comment only, code only, and code with comment lines of a source file)
+METRICS = ['blank', 'comment', 'code', 'mixed']
+METRICS_NONE = (None,) * len(METRICS)
+
+# Output Formats
+FORMAT_EXCEL = 'excel'
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+FORMAT_COLUMNAR = 'columnar'
+FORMATS = [FORMAT_EXCEL, FORMAT_CSV, FORMAT_JSONL, FORMAT_COLUMNAR]
+FORMATS_DEFAULT = [FORMAT_EXCEL]
+OUT_COLUMNS = ['no', 'path', 'file', 'ext', 'lines', 'steps', 'encoding'] + METRICS
+
+# Columnar Binary Format (little endian)
+#   header : magic, version, number of rows, number of columns
+#   column : name length, name (utf-8), kind, payload length, payload (zlib compressed)
+#   kind   : 'i' int64 array (-1 is null)
+#            's' string offsets (int64 array, rows + 1) and utf-8 bytes
+#            'd' dictionary (as 's' column of distinct values) and int32 indices (-1 is null)
+COLUMNAR_MAGIC = b'SCCC'
+COLUMNAR_VERSION = 1
+COLUMNAR_NULL = -1
+
+OUT_CACHE = os.path.join(OUT_DIR, 'cache.sqlite3')
+
+# Scan Result Cache
+# Increase CACHE_VERSION whenever the counting rules change, so that old results are thrown away.
+CACHE_VERSION = 7
+
+OUT_BASELINE = os.path.join(OUT_DIR, 'baseline.json')
+OUT_PROFILE = os.path.join(OUT_DIR, 'profile.json')
+OUT_PROFILE_STATS = os.path.join(OUT_DIR, 'profile.pstats')
+
+# Profile
+PROFILE_TOP_DEFAULT = 20
+PHASE_PREFIX = 'phase:'
+PHASE_WALK = PHASE_PREFIX + 'walk'
+PHASE_CACHE = PHASE_PREFIX + 'cache'
+PHASE_DEDUP = PHASE_PREFIX + 'dedup'
+PHASE_READ = PHASE_PREFIX + 'read'
+PHASE_DETECT = PHASE_PREFIX + 'detect'
+PHASE_TOKENIZE = PHASE_PREFIX + 'tokenize:'
+PHASE_WRITE = PHASE_PREFIX + 'write:'
+
+# Debug Tokens
+DEBUG_FLUSH_LINES = 4096
+
+# Reading Source Files (files of this size or larger are memory-mapped)
+READ_MMAP_SIZE = 4 * 1024 * 1024
+
+# Counting Lines of Text Files (in chunks of raw bytes, a NUL byte in the head marks a binary file)
+COUNT_CHUNK_SIZE = 1024 * 1024
+BINARY_SNIFF_SIZE = 8000
+
+# Parallel Scanning
+JOBS_DEFAULT = 1
+
+# Pipeline (walker thread -> reader threads -> scanner -> ordered writers)
+# At most PIPELINE_DEPTH files are in flight between the walker and the writers,
+# and they are handed over between the stages in batches of PIPELINE_BATCH files.
+PIPELINE_DEPTH = 256
+PIPELINE_BATCH = 16
+PIPELINE_READERS_DEFAULT = 4
 
 # Excel Cell Position (1 Origin)
 CELL_ROW_OFFSET = 4
@@ -55,26 +326,146 @@ CELL_COL_FILE = 2
 CELL_COL_EXT = 3
 CELL_COL_LINES = 4
 CELL_COL_STEPS = 5
+CELL_COL_ENC = 6
+CELL_COL_BLANK = 7
+CELL_COL_COMMENT = 8
+CELL_COL_CODE = 9
+CELL_COL_MIXED = 10
+CELL_HEADER_ENC = 'Encoding'
+CELL_WIDTH_ENC = 12
+CELL_WIDTH_METRICS = 10
+
+# Excel Columns after the Template (column, header, width), added unless the template has a header there
+CELL_COLUMNS_ADDED = [
+    (CELL_COL_ENC, CELL_HEADER_ENC, CELL_WIDTH_ENC),
+    (CELL_COL_BLANK, 'Blank', CELL_WIDTH_METRICS),
+    (CELL_COL_COMMENT, 'Comment', CELL_WIDTH_METRICS),
+    (CELL_COL_CODE, 'Code', CELL_WIDTH_METRICS),
+    (CELL_COL_MIXED, 'Mixed', CELL_WIDTH_METRICS),
+]
 
-# Output Excel Cell Format
-ALIGN_LEFT = Alignment(horizontal='left', vertical='top', wrap_text=True)
-ALIGN_LEFT_NO_WRAP = Alignment(horizontal='left', vertical='top', wrap_text=False)
-ALIGN_CENTER = Alignment(horizontal='center', vertical='top', wrap_text=True)
-ALIGN_RIGHT = Alignment(horizontal='right', vertical='top', wrap_text=True)
-FONT_MEIRYO = Font(name='Meiryo UI', size=10, color='000000')
-FONT_MEIRYO_GRAY = Font(name='Meiryo UI', size=10, color='C0C0C0')
-FONT_MEIRYO_BOLD = Font(name='Meiryo UI', size=10, color='000000', bold=True)
-FILL_BRIGHT_GRAY = PatternFill(patternType='solid', fgColor='EBECF0')
+# Excel Duplicates Sheet
+DUP_HEADERS = ['Group', 'No.', 'File Path', 'File Name', 'Lines', 'Steps']
+DUP_WIDTHS = [8, 8, 40, 30, 10, 10]
+DUP_TOTAL = 'Total'
+
+# Excel Summary Sheets
+SUM_HEADERS = ['Files', 'Lines', 'Steps', 'Blank', 'Comment', 'Code', 'Mixed']
+SUM_HEADER_DIRECTORY = 'Directory'
+SUM_HEADER_EXTENSION = 'Extension'
+SUM_HEADER_SCANNER = 'Scanner'
+SUM_WIDTHS = [40, 10, 12, 12, 12, 12, 12, 12]
+SUM_TOTAL = 'Total'
+
+# Excel Delta Sheet
+DELTA_HEADERS = ['Status', 'File Path', 'File Name', 'Renamed From',
+                 'Old Lines', 'New Lines', 'Diff Lines', 'Old Steps', 'New Steps', 'Diff Steps']
+DELTA_WIDTHS = [8, 40, 30, 40, 10, 10, 10, 10, 10, 10]
+DELTA_TOTAL = 'Total'
+
+# Git Mode (statuses of git diff --name-status)
+GIT_ADDED = 'A'
+GIT_MODIFIED = 'M'
+GIT_DELETED = 'D'
+GIT_RENAMED = 'R'
+GIT_COPIED = 'C'
+BASELINE_VERSION = 2
+
+# Watch Mode
+WATCH_INTERVAL_DEFAULT = 1.0
+
+# Ignore Rules (gitignore syntax)
+GIT_DIR = '.git'
+GITIGNORE = '.gitignore'
+GIT_INFO_EXCLUDE = os.path.join(GIT_DIR, 'info', 'exclude')
+IGNORE_CASE = os.path.normcase('A') == 'a'
+
+# Scanner Types
+SCANNER_PYTHON = 'python'
+SCANNER_PYTHON_TOKENIZE = 'python-tokenize'
+SCANNER_JAVA = 'java'
+SCANNER_SQL = 'sql'
+SCANNER_CSHARP = 'csharp'
+SCANNER_JAVASCRIPT = 'javascript'
+SCANNER_GO = 'go'
+SCANNER_SHELL = 'shell'
+SCANNER_XML = 'xml'
+SCANNER_TEXT = 'text'
+SCANNER_IGNORE = 'ignore'
+SCANNERS = [SCANNER_PYTHON, SCANNER_PYTHON_TOKENIZE, SCANNER_JAVA, SCANNER_SQL, SCANNER_CSHARP, SCANNER_JAVASCRIPT,
+            SCANNER_GO, SCANNER_SHELL, SCANNER_XML, SCANNER_TEXT, SCANNER_IGNORE]
+
+# Line Kinds of the tokenize Engine (a line of more than one kind is the higher one)
+LINE_BLANK = 0
+LINE_COMMENT = 1
+LINE_DOCSTRING = 2
+LINE_CODE = 3
+LINE_MIXED = 4
+LINE_KINDS = ['blank', 'comment', 'docstring', 'code', 'mixed']
+
+# Extension to Scanner (other extensions are text, changed by --map)
+EXTENSIONS = {
+    '.py': SCANNER_PYTHON,
+    '.java': SCANNER_JAVA,
+    '.c': SCANNER_JAVA,
+    '.cpp': SCANNER_JAVA,
+    '.sql': SCANNER_SQL,
+    '.cs': SCANNER_CSHARP,
+    '.js': SCANNER_JAVASCRIPT,
+    '.mjs': SCANNER_JAVASCRIPT,
+    '.cjs': SCANNER_JAVASCRIPT,
+    '.jsx': SCANNER_JAVASCRIPT,
+    '.ts': SCANNER_JAVASCRIPT,
+    '.mts': SCANNER_JAVASCRIPT,
+    '.cts': SCANNER_JAVASCRIPT,
+    '.tsx': SCANNER_JAVASCRIPT,
+    '.go': SCANNER_GO,
+    '.sh': SCANNER_SHELL,
+    '.bash': SCANNER_SHELL,
+    '.ksh': SCANNER_SHELL,
+    '.zsh': SCANNER_SHELL,
+    '.xml': SCANNER_XML,
+    '.xsd': SCANNER_XML,
+    '.xsl': SCANNER_XML,
+    '.xslt': SCANNER_XML,
+    '.html': SCANNER_XML,
+    '.htm': SCANNER_XML,
+    '.xhtml': SCANNER_XML,
+    '.txt': SCANNER_TEXT,
+}
+
+# Config File
+CONFIG_SECTION = 'source_code_counter'
+CONFIG_SECTION_EXTENSIONS = 'extensions'
+
+# openpyxl (imported by import_openpyxl())
+openpyxl = None
+WriteOnlyCell = None
+NamedStyle = None
+
+# Output Excel Cell Format (openpyxl objects, created by import_openpyxl())
+ALIGN_LEFT = None
+ALIGN_LEFT_NO_WRAP = None
+ALIGN_CENTER = None
+ALIGN_RIGHT = None
+FONT_MEIRYO = None
+FONT_MEIRYO_GRAY = None
+FONT_MEIRYO_BOLD = None
+FILL_BRIGHT_GRAY = None
 NUMBER_FORMAT = '#,##0_ '
-BORDER_ALL = Border(
-    top=Side(style='thin', color='000000'),
-    bottom=Side(style='thin', color='000000'),
-    left=Side(style='thin', color='000000'),
-    right=Side(style='thin', color='000000'))
+BORDER_ALL = None
+
+# Output Excel Named Styles (shared by all data cells)
+STYLE_NUMBER = 'Counter Number'
+STYLE_TEXT = 'Counter Text'
+STYLE_CENTER = 'Counter Center'
+STYLE_HEADER = 'Counter Header'
 
 # For Message
 MSG_ERROR = 'error'
 MSG_NORMAL = 'normal'
+MSG_IGNORE = 'ignore'
+MSG_BINARY = 'binary'
 
 # For Characters
 # 'noqa' means ignore PEP 8 warning.
@@ -200,40 +591,392 @@ CH_SIGNS_OF_SQL = [
 
 CH_DELIMITERS = [' ', '\t', '　']
 
+# Scan Rules of Languages (the name is also the scanner type)
+#   name           : name of the language (for the profile)
+#   line_comments  : starts of a comment up to the end of line
+#   line_comment_after : signs after which a line comment may start, besides delimiters and the start of the line
+#                    (e.g. shell, where # starts a comment only at the start of a word), or None for anywhere
+#   block_comments : (start, end) of a comment, which may span lines
+#   strings        : (quotation, escape) of a string constant up to the end of line,
+#                    the escape is the quotation itself when it is doubled (e.g. SQL '')
+#   block_strings  : (start, end, escape) of a string constant which may span lines (e.g. JavaScript `...`),
+#                    the escape is None for a raw string, or the end itself when it is doubled (e.g. C# @"")
+#   heredoc        : (first letter, regular expression) of the start of a here document, whose group 'tag'
+#                    is the line which ends it, or None
+#   line_breaks    : signs which end the scanning of a line outside of a string constant
+#   signs          : sign marks, each of them is a token
+RULES_OF_PYTHON = {
+    'name': 'python',
+    'line_comments': [SIGN_HASH],
+    'line_comment_after': None,
+    'block_comments': [(SIGN_DOUBLE_QUOTATION * 3, SIGN_DOUBLE_QUOTATION * 3)],
+    'strings': [(SIGN_DOUBLE_QUOTATION, SIGN_BACK_SLASH), (SIGN_SINGLE_QUOTATION, SIGN_BACK_SLASH)],
+    'block_strings': [],
+    'heredoc': None,
+    'line_breaks': [SIGN_BACK_SLASH],
+    'signs': CH_SIGNS_OF_PYTHON,
+}
+
+RULES_OF_JAVA = {
+    'name': 'java',
+    'line_comments': [SIGN_SLASH * 2],
+    'line_comment_after': None,
+    'block_comments': [(SIGN_SLASH + SIGN_ASTERISK, SIGN_ASTERISK + SIGN_SLASH)],
+    'strings': [(SIGN_DOUBLE_QUOTATION, SIGN_BACK_SLASH), (SIGN_SINGLE_QUOTATION, SIGN_BACK_SLASH)],
+    'block_strings': [],
+    'heredoc': None,
+    'line_breaks': [SIGN_BACK_SLASH],
+    'signs': CH_SIGNS_OF_JAVA + [SIGN_SLASH, SIGN_ASTERISK],
+}
+
+RULES_OF_SQL = {
+    'name': 'sql',
+    'line_comments': [SIGN_MINUS * 2, SIGN_SLASH * 2],
+    'line_comment_after': None,
+    'block_comments': [(SIGN_SLASH + SIGN_ASTERISK, SIGN_ASTERISK + SIGN_SLASH)],
+    'strings': [(SIGN_SINGLE_QUOTATION, SIGN_SINGLE_QUOTATION), (SIGN_DOUBLE_QUOTATION, SIGN_DOUBLE_QUOTATION)],
+    'block_strings': [],
+    'heredoc': None,
+    'line_breaks': [],
+    'signs': CH_SIGNS_OF_SQL + [SIGN_MINUS, SIGN_SLASH, SIGN_ASTERISK],
+}
+
+# C# (raw """...""" and verbatim @"..." strings may span lines)
+RULES_OF_CSHARP = {
+    'name': 'csharp',
+    'line_comments': [SIGN_SLASH * 2],
+    'line_comment_after': None,
+    'block_comments': [(SIGN_SLASH + SIGN_ASTERISK, SIGN_ASTERISK + SIGN_SLASH)],
+    'strings': [(SIGN_DOUBLE_QUOTATION, SIGN_BACK_SLASH), (SIGN_SINGLE_QUOTATION, SIGN_BACK_SLASH)],
+    'block_strings': [(SIGN_DOUBLE_QUOTATION * 3, SIGN_DOUBLE_QUOTATION * 3, None),
+                      (SIGN_AT + SIGN_DOUBLE_QUOTATION, SIGN_DOUBLE_QUOTATION, SIGN_DOUBLE_QUOTATION),
+                      (SIGN_AT + SIGN_DOLLARS + SIGN_DOUBLE_QUOTATION, SIGN_DOUBLE_QUOTATION, SIGN_DOUBLE_QUOTATION)],
+    'heredoc': None,
+    'line_breaks': [],
+    'signs': CH_SIGNS_OF_JAVA + [SIGN_SLASH, SIGN_ASTERISK],
+}
+
+# JavaScript and TypeScript (template literals `...` may span lines)
+RULES_OF_JAVASCRIPT = {
+    'name': 'javascript',
+    'line_comments': [SIGN_SLASH * 2],
+    'line_comment_after': None,
+    'block_comments': [(SIGN_SLASH + SIGN_ASTERISK, SIGN_ASTERISK + SIGN_SLASH)],
+    'strings': [(SIGN_DOUBLE_QUOTATION, SIGN_BACK_SLASH), (SIGN_SINGLE_QUOTATION, SIGN_BACK_SLASH)],
+    'block_strings': [(SIGN_BACK_APOSTROPHE, SIGN_BACK_APOSTROPHE, SIGN_BACK_SLASH)],
+    'heredoc': None,
+    'line_breaks': [],
+    'signs': CH_SIGNS_OF_JAVA + [SIGN_SLASH, SIGN_ASTERISK],
+}
+
+# Go (raw strings `...` may span lines, and have no escape)
+RULES_OF_GO = {
+    'name': 'go',
+    'line_comments': [SIGN_SLASH * 2],
+    'line_comment_after': None,
+    'block_comments': [(SIGN_SLASH + SIGN_ASTERISK, SIGN_ASTERISK + SIGN_SLASH)],
+    'strings': [(SIGN_DOUBLE_QUOTATION, SIGN_BACK_SLASH), (SIGN_SINGLE_QUOTATION, SIGN_BACK_SLASH)],
+    'block_strings': [(SIGN_BACK_APOSTROPHE, SIGN_BACK_APOSTROPHE, None)],
+    'heredoc': None,
+    'line_breaks': [],
+    'signs': CH_SIGNS_OF_JAVA + [SIGN_SLASH, SIGN_ASTERISK],
+}
+
+# Shell (quoted strings may span lines, and the lines of a here document <<TAG ... TAG are steps)
+RULES_OF_SHELL = {
+    'name': 'shell',
+    'line_comments': [SIGN_HASH],
+    'line_comment_after': [SIGN_SEMI_COLON, SIGN_AMPERSAND, SIGN_VERTICAL, SIGN_LEFT_PAREN,
+                           SIGN_RIGHT_PAREN, SIGN_LESS_THAN, SIGN_GREATER_THAN],
+    'block_comments': [],
+    'strings': [],
+    'block_strings': [(SIGN_DOUBLE_QUOTATION, SIGN_DOUBLE_QUOTATION, SIGN_BACK_SLASH),
+                      (SIGN_SINGLE_QUOTATION, SIGN_SINGLE_QUOTATION, None)],
+    'heredoc': (SIGN_LESS_THAN, r'(?<!<)<<-?[ \t]*(?P<quote>[\'"]?)(?P<tag>[A-Za-z_][A-Za-z0-9_]*)(?P=quote)'),
+    'line_breaks': [],
+    'signs': CH_SIGNS_OF_PYTHON,
+}
+
+# XML and HTML
+RULES_OF_XML = {
+    'name': 'xml',
+    'line_comments': [],
+    'line_comment_after': None,
+    'block_comments': [(SIGN_LESS_THAN + SIGN_EXCLAMATION + SIGN_MINUS * 2, SIGN_MINUS * 2 + SIGN_GREATER_THAN)],
+    'strings': [],
+    'block_strings': [],
+    'heredoc': None,
+    'line_breaks': [],
+    'signs': CH_SIGNS_OF_JAVA + [SIGN_SLASH, SIGN_ASTERISK],
+}
+
+
+# File Result (one row of the outputs)
+# The scanners fill in the counts, the encoding and the status (MSG_*, None for the rows of the baseline), and
+# the writer of the rows sets the row number, the relative directory and the file name with set_row().
+# profile is the timing of the phases of the file, or None.
+class FileResult:
+
+    __slots__ = ('no', 'path', 'file', 'ext', 'lines', 'steps', 'msg', 'enc', 'metrics', 'profile')
+
+    def __init__(self, lines: Union[int, None], steps: Union[int, None], msg: Union[str, None],
+                 enc: Union[str, None], metrics: Union[tuple, None] = None) -> None:
+        self.no = None
+        self.path = None
+        self.file = None
+        self.ext = None
+        self.lines = lines
+        self.steps = steps
+        self.msg = msg
+        self.enc = enc
+        self.metrics = metrics
+        self.profile = None
+        return
+
+    def set_row(self, no: int, path: str, file: str) -> 'FileResult':
+        self.no = no
+        self.path = path
+        self.file = file
+        self.ext = os.path.splitext(file)[1]
+        return self
 
-# Write Excel
-class WriteExcel:
+
+# Write Output (Interface of Output Sinks)
+class WriteOutput:
+
+    # Rows in order, a list of FileResult.
+    def write_rows(self, results: list) -> None:
+        raise NotImplementedError
+
+    # Groups of duplicate files, each a list of FileResult in row order.
+    def write_duplicates(self, groups: list) -> None:
+        return
+
+    # Totals of WriteSummary, written before close().
+    def write_summary(self, summary) -> None:
+        return
+
+    # Changes of the git mode, each (status, path, file, renamed from, old lines, new lines, old steps, new steps).
+    def write_delta(self, deltas: list) -> None:
+        return
+
+    def close(self) -> None:
+        return
+
+
+# Import openpyxl and Create the Excel Cell Formats
+# openpyxl takes about half of the start time, so it is imported only when an Excel file is written.
+def import_openpyxl() -> None:
+
+    global openpyxl, WriteOnlyCell, NamedStyle
+    global ALIGN_LEFT, ALIGN_LEFT_NO_WRAP, ALIGN_CENTER, ALIGN_RIGHT
+    global FONT_MEIRYO, FONT_MEIRYO_GRAY, FONT_MEIRYO_BOLD, FILL_BRIGHT_GRAY, BORDER_ALL
+
+    if BORDER_ALL is not None:
+        return
+
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
+    from openpyxl.styles.borders import Border, Side
+
+    ALIGN_LEFT = Alignment(horizontal='left', vertical='top', wrap_text=True)
+    ALIGN_LEFT_NO_WRAP = Alignment(horizontal='left', vertical='top', wrap_text=False)
+    ALIGN_CENTER = Alignment(horizontal='center', vertical='top', wrap_text=True)
+    ALIGN_RIGHT = Alignment(horizontal='right', vertical='top', wrap_text=True)
+    FONT_MEIRYO = Font(name='Meiryo UI', size=10, color='000000')
+    FONT_MEIRYO_GRAY = Font(name='Meiryo UI', size=10, color='C0C0C0')
+    FONT_MEIRYO_BOLD = Font(name='Meiryo UI', size=10, color='000000', bold=True)
+    FILL_BRIGHT_GRAY = PatternFill(patternType='solid', fgColor='EBECF0')
+    BORDER_ALL = Border(
+        top=Side(style='thin', color='000000'),
+        bottom=Side(style='thin', color='000000'),
+        left=Side(style='thin', color='000000'),
+        right=Side(style='thin', color='000000'))
+    return
+
+
+# Write Excel (Streaming)
+class WriteExcel(WriteOutput):
 
     def __init__(self, in_excel: str, out_excel: str, out_sheet: str) -> None:
-        shutil.copy(in_excel, out_excel)
-        self._wb = openpyxl.load_workbook(out_excel)
-        self._sheet = self._wb[out_sheet]
+        import_openpyxl()
+        self._wb = openpyxl.Workbook(write_only=True)
+        self._sheet = self._wb.create_sheet(out_sheet)
+        for name, font, align, number_format in (
+                (STYLE_NUMBER, FONT_MEIRYO, None, NUMBER_FORMAT),
+                (STYLE_TEXT, FONT_MEIRYO, ALIGN_LEFT_NO_WRAP, 'General'),
+                (STYLE_CENTER, FONT_MEIRYO, ALIGN_CENTER, 'General'),
+                (STYLE_HEADER, FONT_MEIRYO_BOLD, ALIGN_CENTER, 'General')):
+            style = NamedStyle(name=name, font=font, border=BORDER_ALL, number_format=number_format)
+            if align is not None:
+                style.alignment = align
+            if name == STYLE_HEADER:
+                style.fill = FILL_BRIGHT_GRAY
+            self._wb.add_named_style(style)
         self._row_offset = CELL_ROW_OFFSET
         self._col_offset = CELL_COL_OFFSET
         self._row = 0
+        # Styles of the columns in the order of CELL_COL_*
+        self._styles = ((STYLE_NUMBER, STYLE_TEXT, STYLE_TEXT, STYLE_CENTER, STYLE_NUMBER, STYLE_NUMBER, STYLE_CENTER) +
+                        (STYLE_NUMBER,) * len(METRICS))
         self._out_excel = out_excel
+        template = openpyxl.load_workbook(in_excel)
+        self._write_header(template[out_sheet])
+        template.close()
         return
 
-    def next_row(self) -> None:
-        self._row += 1
+    @staticmethod
+    def _copy_style(src, dst) -> None:
+        dst.font = copy.copy(src.font)
+        dst.fill = copy.copy(src.fill)
+        dst.border = copy.copy(src.border)
+        dst.alignment = copy.copy(src.alignment)
+        dst.number_format = src.number_format
+        return
+
+    # Copy the layout and the header rows above CELL_ROW_OFFSET from the template.
+    # Styles of rows and columns must be set before the first row is written.
+    def _write_header(self, sheet_in) -> None:
+
+        self._sheet.sheet_format = copy.copy(sheet_in.sheet_format)
+        self._sheet.page_margins = copy.copy(sheet_in.page_margins)
+        self._sheet.page_setup.orientation = sheet_in.page_setup.orientation
+        self._sheet.page_setup.paperSize = sheet_in.page_setup.paperSize
+        self._sheet.HeaderFooter = copy.deepcopy(sheet_in.HeaderFooter)
+        self._sheet.freeze_panes = sheet_in.freeze_panes
+
+        for key, dim_in in sheet_in.column_dimensions.items():
+            dim = self._sheet.column_dimensions[key]
+            dim.min, dim.max, dim.width = dim_in.min, dim_in.max, dim_in.width
+            if dim_in.has_style:
+                self._copy_style(dim_in, dim)
+
+        for row in range(1, self._row_offset):
+            if row in sheet_in.row_dimensions:
+                dim_in = sheet_in.row_dimensions[row]
+                dim = self._sheet.row_dimensions[row]
+                dim.height = dim_in.height
+                if dim_in.has_style:
+                    self._copy_style(dim_in, dim)
+
+        # The encoding and the line metrics columns are not in the template, so they take the style of the
+        # steps header.
+        row_header = self._row_offset - 1
+        col_steps = self._col_offset + CELL_COL_STEPS
+        col_last = self._col_offset + CELL_COLUMNS_ADDED[-1][0]
+        headers_added = {}
+        for i_col, header, width in CELL_COLUMNS_ADDED:
+            col = self._col_offset + i_col
+            if sheet_in.cell(row=row_header, column=col).value is None:
+                headers_added[col] = header
+                dim = self._sheet.column_dimensions[openpyxl.utils.get_column_letter(col)]
+                dim.min, dim.max, dim.width = col, col, width
+
+        for row in range(1, self._row_offset):
+            cells = []
+            for col in range(1, max(sheet_in.max_column, col_last) + 1):
+                cell_in = sheet_in.cell(row=row, column=col)
+                if row == row_header and col in headers_added:
+                    cell_in = sheet_in.cell(row=row, column=col_steps)
+                    cell = WriteOnlyCell(self._sheet, value=headers_added[col])
+                else:
+                    cell = WriteOnlyCell(self._sheet, value=cell_in.value)
+                if cell_in.has_style:
+                    self._copy_style(cell_in, cell)
+                cells.append(cell)
+            self._sheet.append(cells)
+
+        if sheet_in.auto_filter.ref:
+            ref = sheet_in.auto_filter.ref
+            if headers_added:
+                ref = '%s:%s%d' % (ref.split(':')[0], openpyxl.utils.get_column_letter(col_last), row_header)
+            self._sheet.auto_filter.ref = ref
+
         return
 
     def get_count(self) -> int:
         return self._row + 1
 
-    def write_cell(self, i_col: int, i_value: Union[int, str],
-                   i_align: Alignment = None, i_font: Font = None, i_format: str = None) -> None:
-        self._sheet.cell(row=self._row_offset + self._row, column=self._col_offset + i_col).border = BORDER_ALL
-        if i_value is not None:
-            self._sheet.cell(row=self._row_offset + self._row, column=self._col_offset + i_col).value = i_value
-        if i_align is not None:
-            self._sheet.cell(row=self._row_offset + self._row, column=self._col_offset + i_col).alignment = i_align
-        if i_font is not None:
-            self._sheet.cell(row=self._row_offset + self._row, column=self._col_offset + i_col).font = i_font
-        else:
-            self._sheet.cell(row=self._row_offset + self._row, column=self._col_offset + i_col).font = FONT_MEIRYO
-        if i_format is not None:
-            self._sheet.cell(row=self._row_offset + self._row, column=self._col_offset + i_col).number_format = i_format
+    def write_rows(self, results: list) -> None:
+        sheet = self._sheet
+        styles = self._styles
+        cells_offset = [None] * (self._col_offset - 1)
+        for result in results:
+            cells = list(cells_offset)
+            for value, style in zip((result.no, result.path, result.file, result.ext,
+                                     result.lines, result.steps, result.enc) + (result.metrics or METRICS_NONE),
+                                    styles):
+                cell = WriteOnlyCell(sheet, value=value)
+                cell.style = style
+                cells.append(cell)
+            sheet.append(cells)
+        self._row += len(results)
+        return
+
+    # Extra sheet after the list, with a header row.
+    def _create_sheet(self, name: str, headers: list, widths: list):
+        sheet = self._wb.create_sheet(name)
+        for col, width in enumerate(widths, 1):
+            sheet.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
+        self._append(sheet, headers, [STYLE_HEADER] * len(headers))
+        return sheet
+
+    @staticmethod
+    def _append(sheet, values: tuple, styles: tuple) -> None:
+        cells = []
+        for value, style in zip(values, styles):
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.style = style
+            cells.append(cell)
+        sheet.append(cells)
+        return
+
+    def write_duplicates(self, groups: list) -> None:
+
+        sheet = self._create_sheet(OUT_SHEET_DUPLICATES, DUP_HEADERS, DUP_WIDTHS)
+        dup_files, dup_lines, dup_steps = 0, 0, 0
+        for i_group, group in enumerate(groups, 1):
+            for result in group:
+                self._append(sheet, (i_group, result.no, result.path, result.file, result.lines, result.steps),
+                             (STYLE_NUMBER, STYLE_NUMBER, STYLE_TEXT, STYLE_TEXT, STYLE_NUMBER, STYLE_NUMBER))
+            # Copies other than the first one
+            for result in group[1:]:
+                dup_files += 1
+                dup_lines += result.lines or 0
+                dup_steps += result.steps or 0
+        self._append(sheet, (DUP_TOTAL, dup_files, '%d groups, %d duplicate files' % (len(groups), dup_files),
+                             None, dup_lines, dup_steps),
+                     (STYLE_HEADER, STYLE_NUMBER, STYLE_TEXT, STYLE_TEXT, STYLE_NUMBER, STYLE_NUMBER))
+        return
+
+    def write_summary(self, summary) -> None:
+
+        styles = (STYLE_TEXT,) + (STYLE_NUMBER,) * len(SUM_HEADERS)
+        for name, header, totals, is_total in (
+                (OUT_SHEET_DIRECTORIES, SUM_HEADER_DIRECTORY, summary.get_directories(), False),
+                (OUT_SHEET_EXTENSIONS, SUM_HEADER_EXTENSION, summary.get_extensions(), True),
+                (OUT_SHEET_SCANNERS, SUM_HEADER_SCANNER, summary.get_scanners(), True)):
+            sheet = self._create_sheet(name, [header] + SUM_HEADERS, SUM_WIDTHS)
+            for key, total in totals:
+                self._append(sheet, (key,) + total, styles)
+            # The top directory is the total of the directories.
+            if is_total:
+                self._append(sheet, (SUM_TOTAL,) + summary.get_total(), (STYLE_HEADER,) + styles[1:])
+        return
+
+    def write_delta(self, deltas: list) -> None:
+
+        sheet = self._create_sheet(OUT_SHEET_DELTA, DELTA_HEADERS, DELTA_WIDTHS)
+        styles = (STYLE_CENTER, STYLE_TEXT, STYLE_TEXT, STYLE_TEXT) + (STYLE_NUMBER,) * 6
+        for status, path, file, renamed, old_lines, new_lines, old_steps, new_steps in deltas:
+            self._append(sheet, (status, path, file, renamed,
+                                 old_lines, new_lines, get_diff(old_lines, new_lines),
+                                 old_steps, new_steps, get_diff(old_steps, new_steps)), styles)
+        self._append(sheet, (DELTA_TOTAL, '%d files' % len(deltas), None, None, None, None,
+                             sum(get_diff(delta[4], delta[5]) for delta in deltas), None, None,
+                             sum(get_diff(delta[6], delta[7]) for delta in deltas)),
+                     (STYLE_HEADER,) + styles[1:])
         return
 
     def close(self) -> None:
@@ -242,729 +985,1927 @@ class WriteExcel:
         return
 
 
-# Scan Python File
-def scan_python_file(full_path_file: str, fp) -> (int, int, str):
+# Write CSV (Streaming)
+class WriteCsv(WriteOutput):
 
-    for enc in ENCODINGS:
+    def __init__(self, out_csv: str) -> None:
+        self._file = open(out_csv, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(OUT_COLUMNS)
+        return
 
-        num_lines = 0
-        num_steps = 0
-        num_double_q = 0
-        is_comment = False
+    def write_rows(self, results: list) -> None:
+        self._writer.writerows((result.no, result.path, result.file, result.ext, result.lines, result.steps,
+                                result.enc, *(result.metrics or METRICS_NONE)) for result in results)
+        return
 
-        file = open(full_path_file, 'r', encoding=enc)
+    def close(self) -> None:
+        self._file.close()
+        return
 
-        while True:
 
-            try:
-                str_line = file.readline()
-            except Exception:       # noqa
-                file.close()
-                break
+# Write JSON Lines (Streaming)
+class WriteJsonLines(WriteOutput):
 
-            # End of Data
-            if not str_line:
-                file.close()
-                return num_lines, num_steps, MSG_NORMAL
+    def __init__(self, out_jsonl: str) -> None:
+        self._file = open(out_jsonl, 'w', encoding='utf-8', newline='\n')
+        return
 
-            num_lines += 1
+    def write_rows(self, results: list) -> None:
+        self._file.write(''.join(json.dumps(dict(zip(OUT_COLUMNS, (result.no, result.path, result.file, result.ext,
+                                                                   result.lines, result.steps, result.enc,
+                                                                   *(result.metrics or METRICS_NONE)))),
+                                            ensure_ascii=False) + '\n' for result in results))
+        return
 
-            str_line = str_line.rstrip('\n')  # for Display
-            str_comp = str_line.strip()
+    def close(self) -> None:
+        self._file.close()
+        return
 
-            pos_current = 0
-            pos_end = len(str_comp)
 
-            tokens = []
-            str_token = ''
-            str_const = ''
-            is_single_q = False
-            is_escape = False
-            is_ope = False
+# Write Columnar Binary
+class WriteColumnar(WriteOutput):
 
-            while pos_current < pos_end:
+    def __init__(self, out_columnar: str) -> None:
+        self._out_columnar = out_columnar
+        self._no = array.array('q')
+        self._paths = ([], {}, array.array('i'))         # dictionary encoded
+        self._files = (array.array('q', [0]), bytearray())
+        self._exts = ([], {}, array.array('i'))          # dictionary encoded
+        self._lines = array.array('q')
+        self._steps = array.array('q')
+        self._encs = ([], {}, array.array('i'))          # dictionary encoded
+        self._metrics = [array.array('q') for _ in METRICS]
+        return
 
-                ch = str_comp[pos_current]
+    @staticmethod
+    def _add_dict(column: tuple, value: str) -> None:
+        values, indexes, codes = column
+        if value is None:
+            codes.append(COLUMNAR_NULL)
+            return
+        code = indexes.get(value)
+        if code is None:
+            code = indexes[value] = len(values)
+            values.append(value)
+        codes.append(code)
+        return
 
-                # Inside of Comment
-                if is_comment:
-                    if ch == SIGN_DOUBLE_QUOTATION:
-                        num_double_q += 1
-                        if num_double_q == 3:
-                            num_double_q = 0
-                            is_comment = False
+    def write_rows(self, results: list) -> None:
+        offsets, data = self._files
+        for result in results:
+            self._no.append(result.no)
+            self._add_dict(self._paths, result.path)
+            data += result.file.encode('utf-8')
+            offsets.append(len(data))
+            self._add_dict(self._exts, result.ext)
+            self._lines.append(result.lines if result.lines is not None else COLUMNAR_NULL)
+            self._steps.append(result.steps if result.steps is not None else COLUMNAR_NULL)
+            self._add_dict(self._encs, result.enc)
+            for values, value in zip(self._metrics, result.metrics or METRICS_NONE):
+                values.append(value if value is not None else COLUMNAR_NULL)
+        return
 
-                # Inside of String Constant
-                elif str_const != '':
-                    if is_escape:
-                        str_const += ch
-                        is_escape = False
-                    elif ch == SIGN_BACK_SLASH:
-                        str_const += SIGN_BACK_SLASH
-                        is_escape = True
-                    else:
-                        if is_single_q:
-                            if ch == SIGN_SINGLE_QUOTATION:
-                                str_const += SIGN_SINGLE_QUOTATION
-                                tokens.append(str_const)
-                                str_const = ''
-                                is_ope = True
-                                is_single_q = False
-                            else:
-                                str_const += ch
-                        elif num_double_q == 1:
-                            if ch == SIGN_DOUBLE_QUOTATION:
-                                str_const += SIGN_DOUBLE_QUOTATION
-                                tokens.append(str_const)
-                                str_const = ''
-                                is_ope = True
-                                num_double_q = 0
-                            else:
-                                str_const += ch
-
-                # '\''
-                elif ch == SIGN_SINGLE_QUOTATION:
-                    if num_double_q == 1:
-                        str_const = SIGN_DOUBLE_QUOTATION + SIGN_SINGLE_QUOTATION
-                    elif num_double_q == 2:
-                        str_const = SIGN_DOUBLE_QUOTATION + SIGN_DOUBLE_QUOTATION
-                        tokens.append(str_const)
-                        str_const = SIGN_SINGLE_QUOTATION
-                        is_ope = True
-                        num_double_q = 0
-                        is_single_q = True
-                        is_escape = False
-                    else:
-                        str_const = SIGN_SINGLE_QUOTATION
-                        is_single_q = True
-                        is_escape = False
-
-                # '"'
-                elif ch == SIGN_DOUBLE_QUOTATION:
-                    num_double_q += 1
-                    if num_double_q == 3:
-                        is_comment = True
-                        num_double_q = 0
-                    is_escape = False
+    @staticmethod
+    def _pack_strings(offsets: array.array, data: bytes) -> bytes:
+        if sys.byteorder != 'little':
+            offsets = array.array('q', offsets)
+            offsets.byteswap()
+        return offsets.tobytes() + bytes(data)
+
+    @staticmethod
+    def _pack_array(values: array.array) -> bytes:
+        if sys.byteorder != 'little':
+            values = array.array(values.typecode, values)
+            values.byteswap()
+        return values.tobytes()
+
+    def _pack_dict(self, column: tuple) -> bytes:
+        values, indexes, codes = column
+        offsets, data = array.array('q', [0]), bytearray()
+        for value in values:
+            data += value.encode('utf-8')
+            offsets.append(len(data))
+        strings = self._pack_strings(offsets, data)
+        return struct.pack('<I', len(values)) + struct.pack('<Q', len(strings)) + strings + self._pack_array(codes)
 
-                # '#'
-                elif ch == SIGN_HASH:
-                    if num_double_q == 1:
-                        str_const = SIGN_DOUBLE_QUOTATION + SIGN_HASH
-                        continue
-                    elif num_double_q == 2:
-                        str_const = SIGN_DOUBLE_QUOTATION + SIGN_DOUBLE_QUOTATION
-                        tokens.append(str_const)
-                        str_const = ''
-                        num_double_q = 0
-                    else:
-                        if str_token != '':
-                            tokens.append(str_token)
-                            str_token = ''
-                            is_ope = True
-                            num_double_q = 0
-                    break
+    def close(self) -> None:
+        columns = [
+            (b'i', self._pack_array(self._no)),
+            (b'd', self._pack_dict(self._paths)),
+            (b's', self._pack_strings(*self._files)),
+            (b'd', self._pack_dict(self._exts)),
+            (b'i', self._pack_array(self._lines)),
+            (b'i', self._pack_array(self._steps)),
+            (b'd', self._pack_dict(self._encs)),
+        ] + [(b'i', self._pack_array(values)) for values in self._metrics]
+        with open(self._out_columnar, 'wb') as file:
+            file.write(COLUMNAR_MAGIC + struct.pack('<HQH', COLUMNAR_VERSION, len(self._no), len(columns)))
+            for name, (kind, payload) in zip(OUT_COLUMNS, columns):
+                name = name.encode('utf-8')
+                payload = zlib.compress(payload)
+                file.write(struct.pack('<H', len(name)) + name + kind + struct.pack('<Q', len(payload)))
+                file.write(payload)
+        return
 
-                # '\'
-                elif ch == SIGN_BACK_SLASH:
-                    if num_double_q == 1:
-                        str_const = SIGN_DOUBLE_QUOTATION
-                        continue
-                    elif num_double_q == 2:
-                        str_const = SIGN_DOUBLE_QUOTATION + SIGN_DOUBLE_QUOTATION
-                        tokens.append(str_const)
-                        str_const = ''
-                        is_ope = True
-                        num_double_q = 0
-                    elif num_double_q == 3:
-                        is_comment = True
-                        num_double_q = 0
-                    else:
-                        if str_token != '':
-                            tokens.append(str_token)
-                            str_token = ''
-                            is_ope = True
-                            num_double_q = 0
-                    break
 
-                # ' ', '\t', '　'
-                elif ch in CH_DELIMITERS:
-                    if num_double_q == 1:
-                        str_const = SIGN_DOUBLE_QUOTATION + ch
-                    elif num_double_q == 2:
-                        str_const = SIGN_DOUBLE_QUOTATION + SIGN_DOUBLE_QUOTATION
-                        tokens.append(str_const)
-                        str_const = ''
-                        is_ope = True
-                        num_double_q = 0
-                    else:
-                        if str_token != '':
-                            tokens.append(str_token)
-                            str_token = ''
-                            is_ope = True
-                            num_double_q = 0
-
-                # Sign Marks
-                elif ch in CH_SIGNS_OF_PYTHON:
-                    if num_double_q == 1:
-                        str_const = SIGN_DOUBLE_QUOTATION + ch
-                    elif num_double_q == 2:
-                        str_const = SIGN_DOUBLE_QUOTATION + SIGN_DOUBLE_QUOTATION
-                        tokens.append(str_const)
-                        str_const = ''
-                        is_ope = True
-                        num_double_q = 0
-                        tokens.append(ch)
-                    else:
-                        if str_token != '':
-                            tokens.append(str_token)
-                            str_token = ''
-                        tokens.append(ch)
-                        is_ope = True
+# Read Columnar Binary
+def read_columnar(in_columnar: str) -> dict:
+
+    def unpack_strings(payload: bytes, rows: int) -> list:
+        offsets = array.array('q')
+        offsets.frombytes(payload[:(rows + 1) * 8])
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        data = payload[(rows + 1) * 8:]
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(rows)]
+
+    def unpack_array(typecode: str, payload: bytes) -> list:
+        values = array.array(typecode)
+        values.frombytes(payload)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    with open(in_columnar, 'rb') as file:
+        data = file.read()
+
+    if data[:4] != COLUMNAR_MAGIC:
+        raise ValueError('not a columnar file: %s' % in_columnar)
+    version, rows, num_columns = struct.unpack_from('<HQH', data, 4)
+    if version != COLUMNAR_VERSION:
+        raise ValueError('unsupported columnar version %d: %s' % (version, in_columnar))
+
+    columns = {}
+    pos = 4 + struct.calcsize('<HQH')
+    for _ in range(num_columns):
+        length, = struct.unpack_from('<H', data, pos)
+        name = data[pos + 2:pos + 2 + length].decode('utf-8')
+        pos += 2 + length
+        kind = data[pos:pos + 1]
+        length, = struct.unpack_from('<Q', data, pos + 1)
+        payload = zlib.decompress(data[pos + 9:pos + 9 + length])
+        pos += 9 + length
+        if kind == b'i':
+            columns[name] = [None if v == COLUMNAR_NULL else v for v in unpack_array('q', payload)]
+        elif kind == b's':
+            columns[name] = unpack_strings(payload, rows)
+        elif kind == b'd':
+            num_values, length = struct.unpack_from('<IQ', payload, 0)
+            values = unpack_strings(payload[12:12 + length], num_values)
+            codes = unpack_array('i', payload[12 + length:])
+            columns[name] = [None if c == COLUMNAR_NULL else values[c] for c in codes]
+        else:
+            raise ValueError('unknown column kind %r: %s' % (kind, in_columnar))
 
-                # Letters, Numbers
-                else:
-                    if num_double_q == 1:
-                        str_const = SIGN_DOUBLE_QUOTATION + ch
-                    else:
-                        str_token += ch
+    return columns
 
-                pos_current += 1
 
-            # End of One Line
-            if str_const != '':
-                tokens.append(str_const)
-                is_ope = True
-            elif str_token != '':
-                tokens.append(str_token)
-                is_ope = True
+# Write Summary (Running Totals)
+# Files, lines, steps and line metrics per directory (each file is added to its directory and all of the
+# parents), per extension and per scanner. The totals are handed to the other outputs with write_summary().
+class WriteSummary(WriteOutput):
 
-            if fp is not None:
-                strs = ''
-                spc = ''
-                for cnt, val in enumerate(tokens):
-                    strs += spc + '[' + val + ']'
-                    spc = ' '
-                fp.write('%s %5d: %s\n' % ('|' if is_ope else ' ', num_lines, strs))
+    def __init__(self) -> None:
+        self._directories = {}
+        self._extensions = {}
+        self._scanners = {}
+        self._total = [0] * len(SUM_HEADERS)
+        return
 
-            if is_ope:
-                num_steps += 1
+    @staticmethod
+    def _add(total: list, values: tuple) -> None:
+        for i, value in enumerate(values):
+            total[i] += value
+        return
 
-        # End of All lines
+    def write_rows(self, results: list) -> None:
+        for result in results:
+            values = ((1, result.lines or 0, result.steps or 0) +
+                      tuple(value or 0 for value in result.metrics or METRICS_NONE))
+            parts = result.path.split(os.sep)
+            for i in range(1, len(parts) + 1):
+                directory = os.sep.join(parts[:i])
+                if directory != '':
+                    self._add(self._directories.setdefault(directory, [0] * len(SUM_HEADERS)), values)
+            self._add(self._extensions.setdefault(result.ext, [0] * len(SUM_HEADERS)), values)
+            self._add(self._scanners.setdefault(get_scanner_type(result.file), [0] * len(SUM_HEADERS)), values)
+            self._add(self._total, values)
+        return
 
-    print('file encoding error in %s' % full_path_file, file=sys.stderr)
-    return 0, 0, MSG_ERROR
+    # Lists of (key, (files, lines, steps, blank, comment, code, mixed))
+    def get_directories(self) -> list:
+        return [(key, tuple(total)) for key, total in
+                sorted(self._directories.items(), key=lambda item: item[0].lower().split(os.sep))]
 
+    def get_extensions(self) -> list:
+        return [(key, tuple(total))
+                for key, total in sorted(self._extensions.items(), key=lambda item: item[0].lower())]
 
-# Scan Java File
-def scan_java_file(full_path_file: str, fp) -> (int, int, str):
+    def get_scanners(self) -> list:
+        return [(key, tuple(self._scanners[key])) for key in SCANNERS if key in self._scanners]
 
-    for enc in ENCODINGS:
+    def get_total(self) -> tuple:
+        return tuple(self._total)
 
-        num_lines = 0
-        num_steps = 0
-        is_comment = False
+    def close(self) -> None:
+        for key, total in self.get_scanners():
+            print('summary %-10s files %d, lines %d, steps %d' % ((key,) + total[:3]))
+        return
 
-        file = open(full_path_file, 'r', encoding=enc)
 
-        while True:
+# Write Baseline (JSON, for the git mode)
+# The results of all files keyed by the path relative to the source folder (with '/').
+class WriteBaseline(WriteOutput):
+
+    # dirty is the list of the paths which differ from the revision in the working tree.
+    def __init__(self, out_baseline: str, dir_relative: str, revision: Union[str, None], dirty: list) -> None:
+        self._out_baseline = out_baseline
+        self._dir_relative = dir_relative
+        self._revision = revision
+        self._dirty = dirty
+        self._files = {}
+        return
+
+    def write_rows(self, results: list) -> None:
+        for result in results:
+            self._files[get_git_path(self._dir_relative, result.path, result.file)] = [
+                result.lines, result.steps, result.enc, result.metrics]
+        return
+
+    def close(self) -> None:
+        with open(self._out_baseline, 'w', encoding='utf-8') as fd:
+            json.dump({'version': BASELINE_VERSION, 'revision': self._revision, 'dirty': self._dirty,
+                       'files': self._files}, fd, ensure_ascii=False, indent=0)
+        return
+
+
+# Read Baseline
+def read_baseline(in_baseline: str) -> dict:
+
+    with open(in_baseline, 'r', encoding='utf-8') as fd:
+        baseline = json.load(fd)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError('unsupported baseline version: %s' % in_baseline)
+    return baseline
+
+
+# Write Debug (Buffered)
+class WriteDebug:
+
+    def __init__(self, out_debug: str, patterns: list) -> None:
+        self._file = open(out_debug, 'w', encoding='utf-8')
+        self._lines = []
+        if patterns:
+            self._re_target = re.compile('|'.join(fnmatch.translate(os.path.normcase(pattern))
+                                                  for pattern in patterns))
+        else:
+            self._re_target = None
+        return
+
+    def is_target(self, dir_relative: str, file: str) -> bool:
+        if self._re_target is None:
+            return True
+        path = os.path.normcase(os.path.join(dir_relative, file)).replace(os.sep, '/').lstrip('/')
+        return (self._re_target.match(os.path.normcase(file)) is not None or
+                self._re_target.match(path) is not None)
+
+    def write(self, str_line: str) -> None:
+        self._lines.append(str_line)
+        if len(self._lines) >= DEBUG_FLUSH_LINES:
+            self.flush()
+        return
+
+    def flush(self) -> None:
+        self._file.write(''.join(self._lines))
+        self._lines.clear()
+        return
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+        return
+
+
+# Get Wall Time and CPU Time (of the current thread, the walker and reader threads run beside the main one)
+def get_times() -> (float, float):
+    return time.perf_counter(), time.thread_time()
+
+
+# Record Times of a Phase (since the times of get_times())
+def record_times(profile: dict, phase: str, times: (float, float)) -> None:
+    wall, cpu = profile.get(phase, (0.0, 0.0))
+    profile[phase] = (wall + time.perf_counter() - times[0], cpu + time.thread_time() - times[1])
+    return
+
+
+# Profiler
+class Profiler:
 
+    def __init__(self, top: int) -> None:
+        self._phases = {}
+        self._top = top
+        self._slowest = []      # min-heap of (seconds, no, file)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()   # the total is of the whole process, not of a thread
+        return
+
+    # Add a phase of the main process.
+    def add(self, phase: str, times: (float, float)) -> None:
+        record_times(self._phases, phase, times)
+        return
+
+    # Add the phases recorded by record_times() in another thread.
+    def add_phases(self, profile: dict) -> None:
+        for phase, (wall, cpu) in profile.items():
+            total_wall, total_cpu = self._phases.get(phase, (0.0, 0.0))
+            self._phases[phase] = (total_wall + wall, total_cpu + cpu)
+        return
+
+    # Add the phases of one file, which may be scanned in a worker process.
+    def add_file(self, no: int, full_path_file: str, profile: dict) -> None:
+        seconds = 0.0
+        for phase, value in profile.items():
+            if phase.startswith(PHASE_PREFIX):
+                wall, cpu = self._phases.get(phase, (0.0, 0.0))
+                self._phases[phase] = (wall + value[0], cpu + value[1])
+                seconds += value[0]
+        file = {
+            'path': full_path_file,
+            'size': profile.get('size'),
+            'seconds': round(seconds, 6),
+            'encoding': profile.get('encoding'),
+            'retries': profile.get('retries', 0),
+        }
+        if len(self._slowest) < self._top:
+            heapq.heappush(self._slowest, (seconds, no, file))
+        elif self._top > 0 and seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (seconds, no, file))
+        return
+
+    def report(self) -> dict:
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        return {
+            'total': {'wall': round(wall, 6), 'cpu': round(cpu, 6)},
+            'phases': {phase[len(PHASE_PREFIX):]: {'wall': round(wall, 6), 'cpu': round(cpu, 6)}
+                       for phase, (wall, cpu) in sorted(self._phases.items())},
+            'slowest': [file for seconds, no, file in sorted(self._slowest, reverse=True)],
+        }
+
+
+# Hash Content
+def hash_data(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+# Hash File Content
+def hash_file(full_path_file: str) -> bytes:
+    with open(full_path_file, 'rb') as file:
+        return hash_data(file.read())
+
+
+# Scan Result Cache
+class ScanCache:
+
+    def __init__(self, out_cache: str) -> None:
+        self._conn = sqlite3.connect(out_cache)
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != CACHE_VERSION:
+            self._conn.execute('DROP TABLE IF EXISTS files')
+            self._conn.execute('PRAGMA user_version = %d' % CACHE_VERSION)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash BLOB, scanner TEXT, '
+            'lines INTEGER, steps INTEGER, encoding TEXT, msg TEXT, '
+            'blank INTEGER, comment INTEGER, code INTEGER, mixed INTEGER)')
+        self._stats = {}
+        self._hits = 0
+        self._misses = 0
+        return
+
+    # A result of another scanner (the mapping of the extensions has changed) is a miss.
+    def get(self, full_path_file: str, scanner: str, stat: os.stat_result = None) -> Union[FileResult, None]:
+        if stat is None:
+            stat = os.stat(full_path_file)
+        size, mtime, digest = stat.st_size, stat.st_mtime_ns, None
+        row = self._conn.execute(
+            'SELECT size, mtime, hash, scanner, lines, steps, encoding, msg, blank, comment, code, mixed '
+            'FROM files WHERE path = ?',
+            (full_path_file,)).fetchone()
+        if row is not None and row[0] == size and row[3] == scanner:
+            if row[1] == mtime:
+                self._hits += 1
+                return FileResult(row[4], row[5], row[7], row[6], row[8:] if row[8] is not None else None)
+            # Touched but maybe not changed (e.g. checkout), so compare the content.
+            digest = hash_file(full_path_file)
+            if row[2] == digest:
+                self._conn.execute('UPDATE files SET mtime = ? WHERE path = ?', (mtime, full_path_file))
+                self._hits += 1
+                return FileResult(row[4], row[5], row[7], row[6], row[8:] if row[8] is not None else None)
+        self._stats[full_path_file] = (size, mtime, digest)
+        return None
+
+    def put(self, full_path_file: str, scanner: str, result: FileResult, digest: bytes = None) -> None:
+        if result.msg == MSG_IGNORE:
+            return
+        self._misses += 1
+        size, mtime, digest_stat = self._stats.pop(full_path_file, (None, None, None))
+        if size is None:
+            stat = os.stat(full_path_file)
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        if digest is None:
+            digest = digest_stat if digest_stat is not None else hash_file(full_path_file)
+        self._conn.execute(
+            'INSERT OR REPLACE INTO files '
+            '(path, size, mtime, hash, scanner, lines, steps, encoding, msg, blank, comment, code, mixed) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (full_path_file, size, mtime, digest, scanner, result.lines, result.steps, result.enc, result.msg,
+             *(result.metrics or METRICS_NONE)))
+        return
+
+    def get_count(self) -> (int, int):
+        return self._hits, self._misses
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+        return
+
+
+# Decode Source
+def decode_source(data: Union[bytes, mmap.mmap]) -> (Union[str, None], Union[str, None]):
+
+    # BOM
+    head = data[:max(len(bom) for bom, enc in ENCODING_BOMS)]
+    for bom, enc in ENCODING_BOMS:
+        if head.startswith(bom):
             try:
-                str_line = file.readline()
-            except Exception:       # noqa
-                file.close()
-                break
+                return str(data, enc), enc
+            except UnicodeDecodeError:
+                return None, None
+
+    # ASCII (valid in every encoding of ENCODINGS)
+    try:
+        return str(data, ENCODING_ASCII), ENCODING_ASCII
+    except UnicodeDecodeError:
+        pass
+
+    # Strict Trial Decode
+    for enc in ENCODINGS:
+        try:
+            return str(data, enc), enc
+        except UnicodeDecodeError:
+            continue
+
+    return None, None
+
+
+# Apply to Bytes of File
+# The bytes already read by the reader stage, or the whole file at once, memory-mapped if it is large.
+def apply_bytes(full_path_file: str, data: Union[bytes, None], func) -> (int, tuple):
+
+    if data is not None:
+        return len(data), func(data)
+
+    with open(full_path_file, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size >= READ_MMAP_SIZE:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+                return size, func(data_map)
+        return size, func(file.read())
+
+
+# Read Source
+def read_source(full_path_file: str, profile: dict = None,
+                data: bytes = None) -> (Union[list, None], Union[str, None]):
+
+    times = get_times() if profile is not None else None
+
+    size, (text, enc) = apply_bytes(full_path_file, data, decode_source)
+
+    if profile is not None:
+        record_times(profile, PHASE_DETECT, times)
+        profile['size'] = size
+        profile['encoding'] = enc
+        # Failed strict trial decodes before the encoding was found
+        profile['retries'] = ENCODINGS.index(enc) if enc in ENCODINGS else 0 if enc is not None else len(ENCODINGS)
+
+    if text is None:
+        return None, None
+
+    # Same line breaks as the universal newlines mode of open()
+    # (not str.splitlines(), which also breaks at '\f', '\v', '\x1c' .. '\x1e', '\x85' and '\u2028')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    str_lines = text.split('\n')
+    if str_lines[-1] == '':
+        str_lines.pop()
+    return str_lines, enc
+
+
+# Find String End
+# Returns the position after the end of a string constant, or -1 if it does not end in the text.
+def find_string_end(text: str, pos: int, end: str, escape: Union[str, None]) -> int:
+
+    while True:
+        pos_found = text.find(end, pos)
+        if pos_found < 0 or escape is None:
+            return pos_found + len(end) if pos_found >= 0 else -1
+        if escape == end:
+            # Doubled end (e.g. C# @"say ""hi""")
+            if text.startswith(end, pos_found + len(end)):
+                pos = pos_found + len(end) * 2
+                continue
+            return pos_found + len(end)
+        num_escapes = 0
+        while pos_found - num_escapes - 1 >= pos and text[pos_found - num_escapes - 1] == escape:
+            num_escapes += 1
+        if num_escapes % 2 == 0:
+            return pos_found + len(end)
+        pos = pos_found + 1
+
+
+# Scan Engine (Table Driven)
+class ScanEngine:
+
+    def __init__(self, rules: dict) -> None:
+        self.name = rules['name']
+        self.rules = rules
+        self._re_count = None
+        return
+
+    # Compile the rules (at the first file of the language, not at start)
+    def compile(self) -> None:
+
+        rules = self.rules
+
+        # Comments which may span lines, longer starts first (e.g. '"""' before '"')
+        self._block_ends = {}
+        alternatives = []
+        for i, (start, end) in enumerate(sorted(rules['block_comments'], key=lambda r: -len(r[0]))):
+            self._block_ends['block%d' % i] = end
+            alternatives.append('(?P<block%d>%s)' % (i, re.escape(start)))
+
+        # String constants which may span lines, longer starts first (e.g. '"""' before '"'), and here documents
+        self._string_ends = {}
+        for i, (start, end, escape) in enumerate(sorted(rules['block_strings'], key=lambda r: -len(r[0]))):
+            self._string_ends['string%d' % i] = (end, escape)
+            alternatives.append('(?P<string%d>%s)' % (i, re.escape(start)))
+        if rules['heredoc'] is not None:
+            alternatives.append('(?P<heredoc>%s)' % rules['heredoc'][1])
+
+        # Comments up to the end of line, and signs which end the scanning of a line
+        if rules['line_comments']:
+            line = '|'.join(re.escape(start) for start in rules['line_comments'])
+            if rules['line_comment_after'] is not None:
+                class_after = ''.join(re.escape(ch) for ch in CH_DELIMITERS + rules['line_comment_after'])
+                line = '(?<![^%s])(?:%s)' % (class_after, line)
+            alternatives.append('(?P<line>%s)' % line)
+        if rules['line_breaks']:
+            alternatives.append('(?P<stop>%s)' % '|'.join(re.escape(sign) for sign in rules['line_breaks']))
+
+        # String constants up to the closing quotation or the end of line
+        strings = []
+        for quote, escape in rules['strings']:
+            q = re.escape(quote)
+            if escape == quote:
+                strings.append('%s(?:[^%s]|%s%s)*%s?' % (q, q, q, q, q))
+            else:
+                e = re.escape(escape)
+                strings.append('%s(?:[^%s%s]|%s.)*(?:%s|%s)?' % (q, q, e, e, q, e))
+        if strings:
+            alternatives.append('(?P<const>%s)' % '|'.join(strings))
+
+        # First letters of comments, line breaks and string constants
+        markers = set()
+        for start, end in rules['block_comments']:
+            markers.add(start[0])
+        for start in rules['line_comments'] + rules['line_breaks']:
+            markers.add(start[0])
+        for quote, escape in rules['strings']:
+            markers.add(quote[0])
+        for start, end, escape in rules['block_strings']:
+            markers.add(start[0])
+        if rules['heredoc'] is not None:
+            markers.add(rules['heredoc'][0])
+        class_markers = ''.join(re.escape(ch) for ch in sorted(markers))
+        class_delimiters = ''.join(re.escape(ch) for ch in CH_DELIMITERS)
+        class_specials = ''.join(re.escape(ch) for ch in sorted(markers | set(CH_DELIMITERS) | set(rules['signs'])))
+
+        # Delimiters, runs of letters and numbers, and one sign mark (or a lone first letter of the above)
+        self._re_token = re.compile('|'.join(alternatives + [
+            '(?P<space>[%s]+)' % class_delimiters,
+            '(?P<word>[^%s]+)' % class_specials,
+            '(?P<sign>.)']), re.DOTALL)
+
+        # Count Only: whole runs of code up to the next marker are one match, and no token is kept
+        if markers:
+            code = '(?P<code>[^%s%s][^%s]*|.)' % (class_markers, class_delimiters, class_markers)
+        else:
+            code = '(?P<code>.+)'
+        self._re_marker = re.compile('[%s]' % class_markers) if markers else None
+        self._re_count = re.compile('|'.join(alternatives + [
+            '(?P<space>[%s]+)' % class_delimiters, code]), re.DOTALL)
+        return
+
+    # Returns the numbers of lines and steps, and the line metrics (blank, comment, code, mixed).
+    def scan(self, str_lines: list, fp) -> (int, int, tuple):
 
-            # End of Data
-            if not str_line:
-                file.close()
-                return num_lines, num_steps, MSG_NORMAL
+        if fp is None:
+            return self.count(str_lines)
+        if self._re_count is None:
+            self.compile()
+
+        num_lines = 0
+        num_steps = 0
+        num_blanks = 0
+        num_comments = 0
+        num_mixed = 0
+        comment_end = None
+        string_end = None
+        heredoc_end = None
+        finditer = self._re_token.finditer
+        block_ends = self._block_ends
+        string_ends = self._string_ends
+
+        for str_line in str_lines:
 
             num_lines += 1
 
-            str_line = str_line.rstrip('\n')  # for Display
             str_comp = str_line.strip()
 
             pos_current = 0
             pos_end = len(str_comp)
 
             tokens = []
-            str_token = ''
-            str_const = ''
-            is_double_q = False
-            is_single_q = False
-            is_escape = False
-            is_slash = False
-            is_asterisk = False
             is_ope = False
+            is_comment = comment_end is not None
 
-            while pos_current < pos_end:
+            # Inside of Here Document (up to the line of its tag)
+            if heredoc_end is not None and str_comp:
+                tokens.append(str_comp)
+                is_ope = True
+                if str_comp == heredoc_end:
+                    heredoc_end = None
+                pos_current = pos_end
 
-                ch = str_comp[pos_current]
+            pos_token = 0
+            while pos_current < pos_end:
 
                 # Inside of Comment
-                if is_comment:
-                    # before '*' was appeared
-                    if is_asterisk:
-                        # '*/'
-                        if ch == SIGN_SLASH:
-                            is_comment = False
-                        # '**'
-                        elif ch == SIGN_ASTERISK:
-                            is_asterisk = True
-                        # '*?"
-                        else:
-                            is_asterisk = False
-                    # '*'
-                    elif ch == SIGN_ASTERISK:
-                        is_asterisk = True
-
-                # Inside of String Constant
-                elif str_const != '':
-                    if is_escape:
-                        str_const += ch
-                        is_escape = False
-                    elif ch == SIGN_BACK_SLASH:
-                        str_const += SIGN_BACK_SLASH
-                        is_escape = True
-                    else:
-                        if is_single_q:
-                            if ch == SIGN_SINGLE_QUOTATION:
-                                str_const += SIGN_SINGLE_QUOTATION
-                                tokens.append(str_const)
-                                str_const = ''
-                                is_ope = True
-                                is_single_q = False
-                            else:
-                                str_const += ch
-                        elif is_double_q:
-                            if ch == SIGN_DOUBLE_QUOTATION:
-                                str_const += SIGN_DOUBLE_QUOTATION
-                                tokens.append(str_const)
-                                str_const = ''
-                                is_ope = True
-                                is_double_q = False
-                            else:
-                                str_const += ch
-
-                # '/'
-                elif ch == SIGN_SLASH:
-                    if str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
-                        is_ope = True
-                    if is_slash:
-                        is_slash = False
+                if comment_end is not None:
+                    pos_found = str_comp.find(comment_end, pos_current)
+                    if pos_found < 0:
                         break
-                    is_slash = True
-
-                # '*'
-                elif ch == SIGN_ASTERISK:
-                    if str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
-                        is_ope = True
-                    if is_slash:
-                        is_comment = True
-                        is_slash = False
-                    else:
-                        tokens.append(SIGN_ASTERISK)
-                        is_ope = True
-
-                # '\''
-                elif ch == SIGN_SINGLE_QUOTATION:
-                    if is_slash:
-                        tokens.append(SIGN_SLASH)
-                        is_ope = True
-                        is_slash = False
-                    str_const = SIGN_SINGLE_QUOTATION
-                    is_single_q = True
-                    is_escape = False
-
-                # '"'
-                elif ch == SIGN_DOUBLE_QUOTATION:
-                    if is_slash:
-                        tokens.append(SIGN_SLASH)
-                        is_ope = True
-                        is_slash = False
-                    str_const = SIGN_DOUBLE_QUOTATION
-                    is_double_q = True
-                    is_escape = False
-
-                # '\'
-                elif ch == SIGN_BACK_SLASH:
-                    if is_slash:
-                        tokens.append(SIGN_SLASH)
-                        is_ope = True
-                        is_slash = False
-                    elif is_double_q:
-                        str_const = SIGN_DOUBLE_QUOTATION
+                    pos_current = pos_found + len(comment_end)
+                    comment_end = None
+                    continue
+
+                # Inside of String Constant (a token up to its end, or the end of line)
+                if string_end is not None:
+                    pos_found = find_string_end(str_comp, pos_current, *string_end)
+                    pos_current = pos_found if pos_found >= 0 else pos_end
+                    tokens.append(str_comp[pos_token:pos_current])
+                    is_ope = True
+                    if pos_found >= 0:
+                        string_end = None
+                    continue
+
+                # Tokens up to the start of a comment or a string constant which may span lines
+                for match in finditer(str_comp, pos_current):
+                    kind = match.lastgroup
+                    if kind == 'space':
                         continue
-                    else:
-                        if str_token != '':
-                            tokens.append(str_token)
-                            str_token = ''
-                            is_ope = True
-                    break
-
-                # ' ', '\t', '　'
-                elif ch in CH_DELIMITERS:
-                    if is_slash:
-                        tokens.append(SIGN_SLASH)
+                    elif kind in ('word', 'sign', 'const'):
+                        tokens.append(match.group())
                         is_ope = True
-                        is_slash = False
-                    elif is_double_q:
-                        str_const = SIGN_DOUBLE_QUOTATION + ch
-                    else:
-                        if str_token != '':
-                            tokens.append(str_token)
-                            str_token = ''
-                            is_ope = True
-                            is_double_q = False
-
-                # Sign Marks
-                elif ch in CH_SIGNS_OF_JAVA:
-                    if is_slash:
-                        tokens.append(SIGN_SLASH)
+                    elif kind in ('line', 'stop'):
+                        is_comment = is_comment or kind == 'line'
+                        pos_current = pos_end
+                        break
+                    elif kind == 'heredoc':
+                        tokens.append(match.group())
                         is_ope = True
-                        is_slash = False
-                    elif is_double_q:
-                        str_const = SIGN_DOUBLE_QUOTATION + ch
-                    else:
-                        if str_token != '':
-                            tokens.append(str_token)
-                            str_token = ''
-                        tokens.append(ch)
+                        heredoc_end = match.group('tag')
+                    elif kind in string_ends:
+                        string_end = string_ends[kind]
+                        pos_token = match.start()
+                        pos_current = match.end()
                         is_ope = True
-
-                # Letters, Numbers
-                else:
-                    if is_slash:
-                        tokens.append(SIGN_SLASH)
-                        is_ope = True
-                        is_slash = False
-                    if is_double_q:
-                        str_const = SIGN_DOUBLE_QUOTATION + ch
+                        if pos_current == pos_end:
+                            tokens.append(match.group())
+                        break
                     else:
-                        str_token += ch
-
-                pos_current += 1
+                        comment_end = block_ends[kind]
+                        is_comment = True
+                        pos_current = match.end()
+                        break
+                else:
+                    pos_current = pos_end
 
             # End of One Line
-            if is_slash:
-                tokens.append(SIGN_SLASH)
-                is_ope = True
-            elif str_const != '':
-                tokens.append(str_const)
-                is_ope = True
-            elif str_token != '':
-                tokens.append(str_token)
-                is_ope = True
-
             if fp is not None:
-                strs = ''
-                spc = ''
-                for cnt, val in enumerate(tokens):
-                    strs += spc + '[' + val + ']'
-                    spc = ' '
-                fp.write('%s %5d: %s\n' % ('|' if is_ope else ' ', num_lines, strs))
+                fp.write('%s %5d: %s\n' % (
+                    '|' if is_ope else ' ', num_lines, ' '.join(['[' + token + ']' for token in tokens])))
 
             if is_ope:
                 num_steps += 1
+                if is_comment:
+                    num_mixed += 1
+            elif str_comp:
+                num_comments += 1
+            else:
+                num_blanks += 1
 
         # End of All lines
 
-    print('file encoding error in %s' % full_path_file, file=sys.stderr)
-    return 0, 0, MSG_ERROR
-
+        return num_lines, num_steps, (num_blanks, num_comments, num_steps - num_mixed, num_mixed)
 
-# Scan SQL File
-def scan_sql_file(full_path_file: str, fp) -> (int, int, str):
+    # Count only the lines which have code (and the line metrics), without building tokens.
+    # A line without code is a comment line unless it is blank.
+    def count(self, str_lines: list) -> (int, int, tuple):
 
-    for enc in ENCODINGS:
+        if self._re_count is None:
+            self.compile()
 
-        num_lines = 0
         num_steps = 0
-        is_comment = False
-
-        file = open(full_path_file, 'r', encoding=enc)
-
-        while True:
-
-            try:
-                str_line = file.readline()
-            except Exception:       # noqa
-                file.close()
-                break
+        num_blanks = 0
+        num_mixed = 0
+        comment_end = None
+        string_end = None
+        heredoc_end = None
+        finditer = self._re_count.finditer
+        search_marker = self._re_marker.search if self._re_marker is not None else None
+        block_ends = self._block_ends
+        string_ends = self._string_ends
+
+        for str_line in str_lines:
 
-            # End of Data
-            if not str_line:
-                file.close()
-                return num_lines, num_steps, MSG_NORMAL
+            str_comp = str_line.strip()
+            if not str_comp:
+                num_blanks += 1
+                continue
 
-            num_lines += 1
+            # Inside of Here Document (up to the line of its tag)
+            if heredoc_end is not None:
+                num_steps += 1
+                if str_comp == heredoc_end:
+                    heredoc_end = None
+                continue
 
-            str_line = str_line.rstrip('\n')  # for Display
-            str_comp = str_line.strip()
+            # No comment, string constant nor line break can start in this line.
+            if comment_end is None and string_end is None and (search_marker is None or
+                                                               search_marker(str_comp) is None):
+                num_steps += 1
+                continue
 
             pos_current = 0
             pos_end = len(str_comp)
-
-            tokens = []
-            str_token = ''
-            str_const = ''
-            is_double_q = False
-            num_single_q = 0
-            is_minus = False
-            is_slash = False
-            is_asterisk = False
             is_ope = False
+            is_comment = comment_end is not None
 
             while pos_current < pos_end:
 
-                ch = str_comp[pos_current]
-
                 # Inside of Comment
-                if is_comment:
-                    # before '*' was appeared
-                    if is_asterisk:
-                        # '*/'
-                        if ch == SIGN_SLASH:
-                            is_comment = False
-                        # '**'
-                        elif ch == SIGN_ASTERISK:
-                            is_asterisk = True
-                        # '*?"
-                        else:
-                            is_asterisk = False
-                    # '*'
-                    elif ch == SIGN_ASTERISK:
-                        is_asterisk = True
+                if comment_end is not None:
+                    pos_found = str_comp.find(comment_end, pos_current)
+                    if pos_found < 0:
+                        break
+                    pos_current = pos_found + len(comment_end)
+                    comment_end = None
+                    continue
 
                 # Inside of String Constant
-                elif str_const != '':
-                    if num_single_q == 1:
-                        if ch == SIGN_SINGLE_QUOTATION:
-                            str_const += SIGN_SINGLE_QUOTATION
-                            num_single_q = 2
-                        else:
-                            str_const += ch
-                    elif num_single_q == 2:
-                        if ch == SIGN_SINGLE_QUOTATION:
-                            str_const += SIGN_SINGLE_QUOTATION
-                            num_single_q = 1
-                        else:
-                            tokens.append(str_const)
-                            str_const = ''
-                            is_ope = True
-                            num_single_q = 0
-                            continue
-                    elif is_double_q:
-                        if ch == SIGN_DOUBLE_QUOTATION:
-                            str_const += SIGN_DOUBLE_QUOTATION
-                            tokens.append(str_const)
-                            str_const = ''
-                            is_ope = True
-                            is_double_q = False
-                        else:
-                            str_const += ch
-
-                # '/'
-                elif ch == SIGN_SLASH:
-                    if str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
-                        is_ope = True
-                    if is_slash:
-                        is_slash = False
+                if string_end is not None:
+                    is_ope = True
+                    pos_found = find_string_end(str_comp, pos_current, *string_end)
+                    if pos_found < 0:
                         break
-                    is_slash = True
-
-                # '*'
-                elif ch == SIGN_ASTERISK:
-                    if str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
-                        is_ope = True
-                    if is_slash:
-                        is_comment = True
-                        is_slash = False
-                    else:
-                        tokens.append(SIGN_ASTERISK)
+                    pos_current = pos_found
+                    string_end = None
+                    continue
+
+                # Code up to the start of a comment or a string constant which may span lines
+                for match in finditer(str_comp, pos_current):
+                    kind = match.lastgroup
+                    if kind == 'code' or kind == 'const':
                         is_ope = True
-
-                # '-'
-                elif ch == SIGN_MINUS:
-                    # Before '-' is appeared
-                    if is_minus:
-                        is_minus = False
+                    elif kind == 'space':
+                        continue
+                    elif kind in ('line', 'stop'):
+                        is_comment = is_comment or kind == 'line'
+                        pos_current = pos_end
                         break
-                    is_minus = True
-
-                # '\''
-                elif ch == SIGN_SINGLE_QUOTATION:
-                    if is_minus:
-                        tokens.append(SIGN_MINUS)
-                        is_minus = False
-                    elif str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
+                    elif kind == 'heredoc':
                         is_ope = True
-                    str_const = SIGN_SINGLE_QUOTATION
-                    num_single_q = 1
-
-                # '"'
-                elif ch == SIGN_DOUBLE_QUOTATION:
-                    if is_minus:
-                        tokens.append(SIGN_MINUS)
-                        is_minus = False
-                    elif str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
+                        heredoc_end = match.group('tag')
+                    elif kind in string_ends:
                         is_ope = True
-                    str_const = SIGN_DOUBLE_QUOTATION
-                    is_double_q = True
-
-                # ' ', '\t', '　'
-                elif ch in CH_DELIMITERS:
-                    if is_minus:
-                        tokens.append(SIGN_MINUS)
-                        is_minus = False
-                    elif str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
-                    is_ope = True
+                        string_end = string_ends[kind]
+                        pos_current = match.end()
+                        break
+                    else:
+                        comment_end = block_ends[kind]
+                        is_comment = True
+                        pos_current = match.end()
+                        break
+                else:
+                    pos_current = pos_end
 
-                # Sign Marks
-                elif ch in CH_SIGNS_OF_JAVA:
-                    if is_minus:
-                        tokens.append(SIGN_MINUS)
-                        is_minus = False
-                    elif str_token != '':
-                        tokens.append(str_token)
-                        str_token = ''
-                    tokens.append(ch)
-                    is_ope = True
+            if is_ope:
+                num_steps += 1
+                if is_comment:
+                    num_mixed += 1
 
-                # Letters, Numbers
-                else:
-                    str_token += ch
+        num_lines = len(str_lines)
+        return num_lines, num_steps, (num_blanks, num_lines - num_blanks - num_steps, num_steps - num_mixed, num_mixed)
 
-                pos_current += 1
 
-            # End of One Line
-            if is_slash:
-                tokens.append(SIGN_SLASH)
-                is_ope = True
-            elif is_minus:
-                tokens.append(SIGN_MINUS)
-                is_ope = True
-            elif str_const != '':
-                tokens.append(str_const)
-                is_ope = True
-            elif str_token != '':
-                tokens.append(str_token)
-                is_ope = True
+ENGINE_OF_PYTHON = ScanEngine(RULES_OF_PYTHON)
+ENGINE_OF_JAVA = ScanEngine(RULES_OF_JAVA)
+ENGINE_OF_SQL = ScanEngine(RULES_OF_SQL)
 
-            if fp is not None:
-                strs = ''
-                spc = ''
-                for cnt, val in enumerate(tokens):
-                    strs += spc + '[' + val + ']'
-                    spc = ' '
-                fp.write('%s %5d: %s\n' % ('|' if is_ope else ' ', num_lines, strs))
 
-            if is_ope:
-                num_steps += 1
+# Scan Engine of Python (tokenize)
+# Classifies each physical line as code, mixed (code and a comment), comment, docstring (a statement of string
+# constants only) or blank with the tokens of the standard library, in one pass. A file which does not tokenize
+# (e.g. Python 2) is scanned by the fallback engine.
+class TokenizeEngine:
 
-        # End of All lines
+    def __init__(self, name: str, fallback: ScanEngine) -> None:
+        self.name = name
+        self.rules = None
+        self._fallback = fallback
+        return
 
-    print('file encoding error in %s' % full_path_file, file=sys.stderr)
-    return 0, 0, MSG_ERROR
+    # Kinds of the lines, or None if the text does not tokenize
+    def classify(self, str_lines: list) -> Union[list, None]:
+
+        kinds = [LINE_BLANK] * (len(str_lines) + 1)
+        rows_comment = []
+        statement = []
+        num_lines = len(str_lines)
+
+        def mark(tokens: list, kind: int) -> None:
+            for token in tokens:
+                for row in range(token.start[0], min(token.end[0], num_lines) + 1):
+                    if kinds[row] < kind:
+                        kinds[row] = kind
+            return
+
+        try:
+            for token in tokenize.generate_tokens(iter([str_line + '\n' for str_line in str_lines]).__next__):
+                if token.type == tokenize.COMMENT:
+                    mark([token], LINE_COMMENT)
+                    rows_comment.append(token.start[0])
+                elif token.type == tokenize.NEWLINE or token.type == tokenize.ENDMARKER:
+                    # End of a logical line
+                    is_docstring = all(token_statement.type == tokenize.STRING for token_statement in statement)
+                    mark(statement, LINE_DOCSTRING if is_docstring else LINE_CODE)
+                    statement = []
+                elif token.type not in (tokenize.NL, tokenize.INDENT, tokenize.DEDENT):
+                    statement.append(token)
+        except (tokenize.TokenError, SyntaxError):
+            return None
+        for row in rows_comment:
+            if kinds[row] == LINE_CODE:
+                kinds[row] = LINE_MIXED
+        return kinds[1:]
+
+    # Numbers of lines of each kind (in the order of LINE_KINDS), or None if the text does not tokenize
+    def count_kinds(self, str_lines: list) -> Union[list, None]:
+        kinds = self.classify(str_lines)
+        if kinds is None:
+            return None
+        counts = [0] * len(LINE_KINDS)
+        for kind in kinds:
+            counts[kind] += 1
+        return counts
+
+    # Numbers of lines and steps, and the line metrics (a line without tokens, e.g. a lone backslash, is a
+    # comment line unless it is blank)
+    @staticmethod
+    def get_result(kinds: list, str_lines: list) -> (int, int, tuple):
+        counts = [0] * len(LINE_KINDS)
+        num_blanks = 0
+        for kind, str_line in zip(kinds, str_lines):
+            counts[kind] += 1
+            if kind == LINE_BLANK and not str_line.strip():
+                num_blanks += 1
+        num_lines = len(str_lines)
+        num_steps = counts[LINE_CODE] + counts[LINE_MIXED]
+        return num_lines, num_steps, (num_blanks, num_lines - num_blanks - num_steps,
+                                      counts[LINE_CODE], counts[LINE_MIXED])
+
+    def scan(self, str_lines: list, fp) -> (int, int, tuple):
+
+        if fp is None:
+            return self.count(str_lines)
+
+        kinds = self.classify(str_lines)
+        if kinds is None:
+            fp.write('tokenize error, scanned by %s\n' % self._fallback.name)
+            return self._fallback.scan(str_lines, fp)
+        for num_lines, (kind, str_line) in enumerate(zip(kinds, str_lines), 1):
+            fp.write('%s %5d: %-9s %s\n' % (
+                '|' if kind >= LINE_CODE else ' ', num_lines, LINE_KINDS[kind], str_line.strip()))
+        return self.get_result(kinds, str_lines)
+
+    def count(self, str_lines: list) -> (int, int, tuple):
+        kinds = self.classify(str_lines)
+        if kinds is None:
+            return self._fallback.count(str_lines)
+        return self.get_result(kinds, str_lines)
+
+
+ENGINE_OF_PYTHON_TOKENIZE = TokenizeEngine(SCANNER_PYTHON_TOKENIZE, ENGINE_OF_PYTHON)
+
+# Scanner Registry (scanner type to engine, other types are scanned as text)
+ENGINES = {engine.name: engine for engine in [
+    ENGINE_OF_PYTHON,
+    ENGINE_OF_PYTHON_TOKENIZE,
+    ENGINE_OF_JAVA,
+    ENGINE_OF_SQL,
+    ScanEngine(RULES_OF_CSHARP),
+    ScanEngine(RULES_OF_JAVASCRIPT),
+    ScanEngine(RULES_OF_GO),
+    ScanEngine(RULES_OF_SHELL),
+    ScanEngine(RULES_OF_XML),
+]}
+
+
+# Register Scanner (a language of the scan rules above, and its extensions)
+def register_scanner(rules: dict, extensions: list) -> None:
+    ENGINES[rules['name']] = ScanEngine(rules)
+    if rules['name'] not in SCANNERS:
+        SCANNERS.insert(SCANNERS.index(SCANNER_TEXT), rules['name'])
+    for ext in extensions:
+        EXTENSIONS[ext] = rules['name']
+    return
 
 
-# Scan Text File
-def scan_text_file(full_path_file: str) -> (int, int, str):
+# Scan Source File
+def scan_source_file(full_path_file: str, engine: ScanEngine, fp, profile: dict = None,
+                     data: bytes = None) -> FileResult:
+
+    str_lines, enc = read_source(full_path_file, profile, data)
+    if str_lines is None:
+        print('file encoding error in %s' % full_path_file, file=sys.stderr)
+        return FileResult(0, 0, MSG_ERROR, None)
+
+    times = get_times() if profile is not None else None
+    num_lines, num_steps, metrics = engine.scan(str_lines, fp)
+    if profile is not None:
+        record_times(profile, PHASE_TOKENIZE + engine.name, times)
+    return FileResult(num_lines, num_steps, MSG_NORMAL, enc, metrics)
+
+
+# Scan Python File
+def scan_python_file(full_path_file: str, fp, profile: dict = None, data: bytes = None) -> FileResult:
+    return scan_source_file(full_path_file, ENGINE_OF_PYTHON, fp, profile, data)
+
+
+# Scan Java File
+def scan_java_file(full_path_file: str, fp, profile: dict = None, data: bytes = None) -> FileResult:
+    return scan_source_file(full_path_file, ENGINE_OF_JAVA, fp, profile, data)
+
+
+# Scan SQL File
+def scan_sql_file(full_path_file: str, fp, profile: dict = None, data: bytes = None) -> FileResult:
+    return scan_source_file(full_path_file, ENGINE_OF_SQL, fp, profile, data)
+
+
+# Count Lines (same line breaks as the universal newlines mode of open(), without decoding)
+# '\r' and '\n' never appear inside a multibyte character of ENCODINGS, so raw bytes can be counted.
+def count_lines(data: Union[bytes, mmap.mmap, str],
+                lf: Union[bytes, str] = b'\n', cr: Union[bytes, str] = b'\r') -> int:
+
+    num_lines = 0
+    last = data[:0]
+    for offset in range(0, len(data), COUNT_CHUNK_SIZE):
+        chunk = data[offset:offset + COUNT_CHUNK_SIZE]
+        num_lines += chunk.count(lf) + chunk.count(cr) - chunk.count(cr + lf)
+        # '\r\n' across two chunks
+        if last == cr and chunk.startswith(lf):
+            num_lines -= 1
+        last = chunk[-1:]
 
+    # Last Line without Line Break
+    if last not in (data[:0], lf, cr):
+        num_lines += 1
+    return num_lines
+
+
+# Detect Encoding of Text (in chunks, without keeping the decoded text)
+def detect_text(data: Union[bytes, mmap.mmap]) -> Union[str, None]:
+
+    # ASCII (valid in every encoding of ENCODINGS)
+    if all(data[offset:offset + COUNT_CHUNK_SIZE].isascii() for offset in range(0, len(data), COUNT_CHUNK_SIZE)):
+        return ENCODING_ASCII
+
+    # Strict Trial Decode
     for enc in ENCODINGS:
+        decoder = codecs.getincrementaldecoder(enc)()
+        try:
+            for offset in range(0, len(data), COUNT_CHUNK_SIZE):
+                decoder.decode(data[offset:offset + COUNT_CHUNK_SIZE])
+            decoder.decode(b'', True)
+            return enc
+        except UnicodeDecodeError:
+            continue
 
-        num_lines = 0
+    return None
 
-        file = open(full_path_file, 'r', encoding=enc)
 
-        while True:
+# Count Text (number of lines and encoding, ENCODING_BINARY for a binary file)
+def count_text(data: Union[bytes, mmap.mmap]) -> (Union[int, None], Union[str, None]):
 
+    head = data[:BINARY_SNIFF_SIZE]
+
+    # BOM (UTF-16 has NUL bytes and other line breaks, so it is decoded)
+    for bom, enc in ENCODING_BOMS:
+        if head.startswith(bom):
             try:
-                str_line = file.readline()
-            except Exception:       # noqa
-                file.close()
+                text = str(data, enc)
+            except UnicodeDecodeError:
+                return None, None
+            return count_lines(text, '\n', '\r'), enc
+
+    # Binary
+    if b'\0' in head:
+        return None, ENCODING_BINARY
+
+    enc = detect_text(data)
+    if enc is None:
+        return None, None
+    return count_lines(data), enc
+
+
+# Scan Text File
+def scan_text_file(full_path_file: str, profile: dict = None, data: bytes = None) -> FileResult:
+
+    times = get_times() if profile is not None else None
+
+    size, (num_lines, enc) = apply_bytes(full_path_file, data, count_text)
+
+    if profile is not None:
+        record_times(profile, PHASE_DETECT, times)
+        profile['size'] = size
+        profile['encoding'] = enc
+        profile['retries'] = ENCODINGS.index(enc) if enc in ENCODINGS else 0 if enc is not None else len(ENCODINGS)
+
+    if enc is None:
+        print('file encoding error in %s' % full_path_file, file=sys.stderr)
+        return FileResult(None, None, MSG_ERROR, None)
+    if enc == ENCODING_BINARY:
+        return FileResult(None, None, MSG_BINARY, enc)
+
+    return FileResult(num_lines, None, MSG_NORMAL, enc)
+
+
+# Is Ignore File
+def is_ignore_file(file: str) -> bool:
+    base, ext = os.path.splitext(file)
+    return (base.startswith('.') and ext == '') or ext in IGNORE_EXTENDS
+
+
+# Compile Ignore Pattern (a line of .gitignore)
+# Returns (regex, negation, directories only, matched with the name only), or None for a blank or comment line.
+def compile_ignore_pattern(line: str) -> Union[tuple, None]:
+
+    line = line.rstrip('\r\n')
+    if line == '' or line.startswith('#'):
+        return None
+    while line.endswith(' ') and not line.endswith('\\ '):
+        line = line[:-1]
+    is_negate = line.startswith('!')
+    if is_negate or line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    is_dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if line == '':
+        return None
+
+    # A pattern with a slash is relative to the directory of the .gitignore file, the other is matched with the name.
+    is_name = '/' not in line
+    line = line.lstrip('/') if not is_name else line
+
+    regex = []
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if line.startswith('**/', i) and (i == 0 or line[i - 1] == '/'):
+            regex.append('(?:.*/)?')
+            i += 3
+        elif line.startswith('/**', i) and i + 3 == len(line):
+            regex.append('/.*')
+            i += 3
+        elif c == '*':
+            while i < len(line) and line[i] == '*':
+                i += 1
+            regex.append('[^/]*')
+        elif c == '?':
+            regex.append('[^/]')
+            i += 1
+        elif c == '[' and line.find(']', i + 2) >= 0:
+            j = line.find(']', i + 2)
+            chars = line[i + 1:j].replace('\\', '\\\\')
+            if chars[0] in '!^':
+                chars = '^' + chars[1:]
+            regex.append('[' + chars + ']')
+            i = j + 1
+        elif c == '\\' and i + 1 < len(line):
+            regex.append(re.escape(line[i + 1]))
+            i += 2
+        else:
+            regex.append(re.escape(c))
+            i += 1
+
+    # A pattern with an invalid bracket expression (e.g. [z-a] or [!]) is matched literally.
+    flags = re.DOTALL | (re.IGNORECASE if IGNORE_CASE else 0)
+    try:
+        compiled = re.compile(''.join(regex) + '\\Z', flags)
+    except re.error:
+        compiled = re.compile(re.escape(line) + '\\Z', flags)
+    return compiled, is_negate, is_dir_only, is_name
+
+
+# Match Ignore Rules
+# Each rule is (directory of the rule relative to the top with '/', regex, negation, directories only, name only).
+# The last matched rule wins. Returns whether it ignores the path, or None if no rule matches.
+def match_ignore_rules(rules: list, git_path: str, name: str, is_dir: bool) -> Union[bool, None]:
+
+    for base, regex, is_negate, is_dir_only, is_name in reversed(rules):
+        if is_dir_only and not is_dir:
+            continue
+        if is_name:
+            target = name
+        elif git_path.startswith(base):
+            target = git_path[len(base):]
+        else:
+            continue
+        if regex.match(target):
+            return not is_negate
+    return None
+
+
+# Ignore Rules (Precompiled gitignore Patterns)
+# The paths are relative to the top of the git repository (with '/', '' for the top) with gitignore,
+# otherwise to the source folder. The patterns of -x take precedence over the .gitignore files.
+class IgnoreRules:
+
+    def __init__(self, patterns: list, is_gitignore: bool = False) -> None:
+        self.patterns = [rule for rule in map(compile_ignore_pattern, patterns) if rule is not None]
+        self.is_gitignore = is_gitignore
+        return
+
+    # Read the rules of a .gitignore file in a directory
+    def read_rules(self, path: str, base: str) -> list:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                lines = file.read().lstrip('\ufeff').splitlines()
+        except OSError:
+            return []
+        return [(base,) + rule for rule in map(compile_ignore_pattern, lines) if rule is not None]
+
+    # Get the path of a source folder and its rules (of .gitignore and of -x)
+    # The .gitignore file of the source folder itself is read while walking it.
+    def get_root(self, dir_root: str) -> (str, list, list):
+        dir_git, rules_git = '', []
+        dir_top = os.path.abspath(dir_root)
+        while self.is_gitignore and not os.path.exists(os.path.join(dir_top, GIT_DIR)):
+            dir_parent = os.path.dirname(dir_top)
+            if dir_parent == dir_top:
+                dir_top = None
                 break
+            dir_top = dir_parent
+        if self.is_gitignore:
+            rules_git.append(('',) + compile_ignore_pattern(GIT_DIR))
+        if self.is_gitignore and dir_top is not None:
+            rules_git += self.read_rules(os.path.join(dir_top, GIT_INFO_EXCLUDE), '')
+            parts = os.path.relpath(os.path.abspath(dir_root), dir_top).split(os.sep)
+            parts = [] if parts == ['.'] else parts
+            for i in range(len(parts)):
+                base = ''.join(part + '/' for part in parts[:i])
+                rules_git += self.read_rules(os.path.join(dir_top, *parts[:i], GITIGNORE), base)
+            dir_git = ''.join(part + '/' for part in parts)
+        return dir_git, rules_git, [(dir_git,) + rule for rule in self.patterns]
+
+    # Add the rules of the .gitignore file of a directory
+    def add_rules(self, dir_path: str, dir_git: str, rules_git: list) -> list:
+        if not self.is_gitignore:
+            return rules_git
+        return rules_git + self.read_rules(os.path.join(dir_path, GITIGNORE), dir_git)
+
+    def is_ignored(self, rules_git: list, rules_patterns: list, git_path: str, name: str, is_dir: bool) -> bool:
+        is_ignored = match_ignore_rules(rules_patterns, git_path, name, is_dir)
+        if is_ignored is None:
+            is_ignored = match_ignore_rules(rules_git, git_path, name, is_dir)
+        return is_ignored is True
+
+    # Is a file, given by the path relative to the source folder (with '/'), or one of its directories ignored
+    def is_ignored_path(self, dir_root: str, path: str) -> bool:
+        dir_git, rules_git, rules_patterns = self.get_root(dir_root)
+        dir_path = dir_root
+        parts = path.split('/')
+        for i, name in enumerate(parts):
+            if os.path.isfile(os.path.join(dir_path, GITIGNORE)):
+                rules_git = self.add_rules(dir_path, dir_git, rules_git)
+            is_dir = i < len(parts) - 1
+            if self.is_ignored(rules_git, rules_patterns, dir_git + name, name, is_dir):
+                return True
+            dir_path = os.path.join(dir_path, name)
+            dir_git += name + '/'
+        return False
+
+
+# Get Scanner Type
+def get_scanner_type(file: str) -> str:
+
+    # Ignore Files
+    if is_ignore_file(file):
+        return SCANNER_IGNORE
+
+    base, ext = os.path.splitext(file)
+    return EXTENSIONS.get(ext, SCANNER_TEXT)
+
+
+# Set Extensions, Ignore Extensions and Scan Rules
+# Also the initializer of worker processes, which may not share them (e.g. registered scanners).
+def set_extensions(extensions: dict, ignore_extends: list, rules: list = None) -> None:
+    global EXTENSIONS, IGNORE_EXTENDS
+    EXTENSIONS = extensions
+    IGNORE_EXTENDS = ignore_extends
+    for rules_of_language in rules or []:
+        if rules_of_language['name'] not in ENGINES:
+            ENGINES[rules_of_language['name']] = ScanEngine(rules_of_language)
+    return
 
-            # End of Data
-            if not str_line:
-                file.close()
-                return num_lines, None, MSG_NORMAL
 
-            num_lines += 1
+# Scan File
+def scan_file(full_path_file: str, file: str, fp, profile: dict = None, data: bytes = None) -> FileResult:
+
+    scanner = get_scanner_type(file)
+
+    if scanner == SCANNER_IGNORE:
+        return FileResult(None, None, MSG_IGNORE, None)
+    engine = ENGINES.get(scanner)
+    if engine is None:
+        result = scan_text_file(full_path_file, profile, data)
+    else:
+        result = scan_source_file(full_path_file, engine, fp, profile, data)
+    result.profile = profile
+    return result
+
+
+# Scan Files in Worker Process
+# Each job is (full path, file name, debug, profile, bytes). Returns a list of (FileResult, debug lines).
+# Debug lines are buffered and written by the parent process in file order.
+def scan_files_job(jobs: list) -> list:
+
+    results = []
+    for full_path_file, file, is_debug, profile, data in jobs:
+        fp = io.StringIO() if is_debug else None
+        result = scan_file(full_path_file, file, fp, profile, data)
+        results.append((result, fp.getvalue() if fp is not None else None))
+    return results
+
+
+# Scan Files in Worker Process of Watch Mode
+# Each job is (full path, file name). Returns a list of FileResult, with MSG_ERROR for a file which cannot be read
+# (e.g. no permission, or removed after the poll), so that the other files of the batch are not lost.
+def scan_watch_files_job(jobs: list) -> list:
+
+    results = []
+    for full_path_file, file in jobs:
+        try:
+            results.append(scan_file(full_path_file, file, None))
+        except OSError:
+            results.append(FileResult(None, None, MSG_ERROR, None))
+    return results
+
+
+# Read Files in Reader Thread
+# Each job is (full path, file name, debug). Returns a list of (content hash, bytes, profile), and with
+# a process pool the future of scan_files_job, to which the bytes are handed at once (then the list has
+# no bytes). Large files are not read here, the scanner maps them itself.
+def read_files_job(jobs: list, is_profile: bool, is_hash: bool,
+                   executor: ProcessPoolExecutor = None) -> (list, object):
+
+    reads = []
+    for full_path_file, file, is_debug in jobs:
+        profile = {} if is_profile else None
+        times = get_times() if profile is not None else None
+        data, digest = None, None
+        with open(full_path_file, 'rb') as fd:
+            if os.fstat(fd.fileno()).st_size < READ_MMAP_SIZE:
+                data = fd.read()
+                digest = hash_data(data) if is_hash else None
+        if profile is not None:
+            record_times(profile, PHASE_READ, times)
+        reads.append((digest, data, profile))
+
+    if executor is None:
+        return reads, None
+    scanned = executor.submit(scan_files_job, [(full_path_file, file, is_debug, profile, data)
+                                               for (full_path_file, file, is_debug), (digest, data, profile)
+                                               in zip(jobs, reads)])
+    return [(digest, None, None) for digest, data, profile in reads], scanned
+
+
+# Walk Directories (Iterative)
+# Yields (relative directory, file name, DirEntry) of the files of a directory, sorted case-insensitively,
+# and then of its sub directories in the same order, without recursion. Ignored files are skipped, and
+# ignored directories are not listed.
+def walk_directories(dir_root: str, dir_relative: str, ignore_rules: IgnoreRules = None):
+
+    dir_git, rules_git, rules_patterns = ignore_rules.get_root(dir_root) if ignore_rules is not None else ('', [], [])
+    stack = [(dir_root, dir_relative, dir_git, rules_git)]
+
+    while stack:
+
+        dir_path, dir_rel, dir_git, rules_git = stack.pop()
+
+        dirs = []
+        files = []
+
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    files.append(entry)
+                elif entry.is_dir():
+                    dirs.append(entry)
+
+        if ignore_rules is not None:
+            if any(entry.name == GITIGNORE for entry in files):
+                rules_git = ignore_rules.add_rules(dir_path, dir_git, rules_git)
+            files = [entry for entry in files
+                     if not ignore_rules.is_ignored(rules_git, rules_patterns, dir_git + entry.name, entry.name, False)]
+            dirs = [entry for entry in dirs
+                    if not ignore_rules.is_ignored(rules_git, rules_patterns, dir_git + entry.name, entry.name, True)]
+
+        files.sort(key=lambda e: e.name.lower())
+        for entry in files:
+            yield dir_rel, entry.name, entry
+
+        dirs.sort(key=lambda e: e.name.lower(), reverse=True)
+        for entry in dirs:
+            stack.append((entry.path, os.path.join(dir_rel, entry.name), dir_git + entry.name + '/', rules_git))
 
-        # End of All lines
+    return
 
-    print('file encoding error in %s' % full_path_file, file=sys.stderr)
-    return None, None, MSG_ERROR
 
+# Walk Directories in Thread
+# Same as walk_directories(), but the tree is walked by a thread ahead of the caller,
+# at most PIPELINE_DEPTH files ahead (the queue of batches is bounded).
+def walk_in_thread(dir_root: str, dir_relative: str, profiler=None, ignore_rules: IgnoreRules = None):
+
+    batches = queue.Queue(maxsize=max(1, PIPELINE_DEPTH // PIPELINE_BATCH))
+    end = object()
+
+    # Only the walk is timed, not the time blocked on the queue when the caller is behind.
+    def walk() -> None:
+        profile = {}
+        try:
+            batch = []
+            items = walk_directories(dir_root, dir_relative, ignore_rules)
+            while True:
+                times = get_times() if profiler is not None else None
+                item = next(items, end)
+                if profiler is not None:
+                    record_times(profile, PHASE_WALK, times)
+                if item is end:
+                    break
+                batch.append(item)
+                if len(batch) >= PIPELINE_BATCH:
+                    batches.put(batch)
+                    batch = []
+            batches.put(batch)
+        except Exception as e:
+            batches.put(e)
+        if profiler is not None:
+            profiler.add_phases(profile)
+        batches.put(end)
+        return
 
-# Seek Directories
-def seek_directories(write_excel: WriteExcel, level: int, dir_root: str, dir_relative: str, fp) -> None:
+    thread = threading.Thread(target=walk, daemon=True)
+    thread.start()
+    while True:
+        batch = batches.get()
+        if batch is end:
+            break
+        if isinstance(batch, Exception):
+            raise batch
+        yield from batch
+    thread.join()
+    return
+
+
+# Write Results (a batch of rows, a list of FileResult)
+def write_results(writers: list, results: list, profiler: Profiler = None) -> None:
+
+    for writer in writers:
+        times = get_times() if profiler is not None else None
+        writer.write_rows(results)
+        if profiler is not None:
+            profiler.add(PHASE_WRITE + type(writer).__name__, times)
+    for result in results:
+        print('%5d %s %s %s %s %s %s' %
+              (result.no, result.path, result.file, result.ext,
+               result.lines if result.lines is not None else '-', result.steps if result.steps is not None else '-',
+               result.enc if result.enc is not None else '-'))
+    return
+
+
+# Find Duplicate Files
+# Returns the content hash of the hashed files, and the number of the first file with the same extension
+# and the same content for the other copies, both keyed by the row number. Only files whose extension and
+# size collide are hashed.
+def find_duplicates(files_all: list) -> (dict, dict):
+
+    digests = {}
+    firsts = {}
+
+    by_size = {}
+    for no, (dir_relative, file, entry) in enumerate(files_all, 1):
+        if not is_ignore_file(file):
+            by_size.setdefault((os.path.splitext(file)[1], entry.stat().st_size), []).append(no)
+
+    for (ext, size), nos in by_size.items():
+        if len(nos) < 2:
+            continue
+        by_digest = {}
+        for no in nos:
+            digests[no] = hash_file(files_all[no - 1][2].path)
+            first = by_digest.setdefault(digests[no], no)
+            if first != no:
+                firsts[no] = first
+
+    return digests, firsts
+
+
+# Print Duplicates
+def print_duplicates(groups: list) -> None:
+
+    dup_files = sum(len(group) - 1 for group in groups)
+    dup_lines = sum(result.lines or 0 for group in groups for result in group[1:])
+    dup_steps = sum(result.steps or 0 for group in groups for result in group[1:])
+    print('duplicates %d groups, %d files, %d lines, %d steps' % (len(groups), dup_files, dup_lines, dup_steps))
+    return
+
+
+# Get Diff (None counts as 0)
+def get_diff(old: Union[int, None], new: Union[int, None]) -> int:
+    return (new or 0) - (old or 0)
 
-    dirs = []
-    files = []
 
-    for path in os.listdir(dir_root):
-        if os.path.isfile(os.path.join(dir_root, path)):
-            files.append(path)
+# Get Path for Git (relative to the source folder, with '/')
+def get_git_path(dir_relative: str, path: str, file: str) -> str:
+    parts = [part for part in path[len(dir_relative):].split(os.sep) if part != '']
+    return '/'.join(parts + [file])
+
+
+# Get Row Order of a Path for Git (the order of walk_directories(): files first, then sub directories)
+def get_git_order(git_path: str) -> list:
+    parts = git_path.split('/')
+    return [(1, part.lower()) for part in parts[:-1]] + [(0, parts[-1].lower())]
+
+
+# Run Git (in the source folder)
+def run_git(dir_root: str, args: list) -> str:
+    result = subprocess.run(['git', '-C', dir_root] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError('git %s failed: %s' % (' '.join(args), result.stderr.decode('utf-8', 'replace').strip()))
+    return result.stdout.decode('utf-8')
+
+
+# Get Git Revision (None if the source folder is not in a git repository)
+def get_git_revision(dir_root: str) -> Union[str, None]:
+    try:
+        return run_git(dir_root, ['rev-parse', 'HEAD']).strip()
+    except (OSError, RuntimeError):
+        return None
+
+
+# Get Git Changes since a Revision
+# Returns a list of (status, old path, new path) relative to the source folder (with '/'). The old path
+# is None for an added or copied file, and the new path is None for a deleted file.
+def get_git_changes(dir_root: str, revision: str) -> list:
+
+    fields = run_git(dir_root, ['diff', '--name-status', '-z', '-M', '--relative', revision, '--']).split('\0')
+
+    changes = []
+    i = 0
+    while i < len(fields) and fields[i] != '':
+        status = fields[i][0]
+        if status in (GIT_RENAMED, GIT_COPIED):
+            changes.append((status, fields[i + 1] if status == GIT_RENAMED else None, fields[i + 2]))
+            i += 3
+        elif status == GIT_DELETED:
+            changes.append((status, fields[i + 1], None))
+            i += 2
+        else:
+            # Added, Modified and Type Changed files are scanned again.
+            changes.append((status, fields[i + 1] if status != GIT_ADDED else None, fields[i + 1]))
+            i += 2
+    return changes
+
+
+# Get Git Dirty Paths (the paths which differ from HEAD in the working tree, or [] without git)
+def get_git_dirty(dir_root: str) -> list:
+    try:
+        changes = get_git_changes(dir_root, 'HEAD')
+    except (OSError, RuntimeError):
+        return []
+    return sorted({path for status, old_path, new_path in changes for path in (old_path, new_path)
+                   if path is not None})
+
+
+# Add Dirty Paths to Git Changes
+# The paths which were dirty when the baseline was saved are scanned again (or dropped if they are gone),
+# even if they are the same as the revision now, e.g. reverted.
+def add_git_dirty(dir_root: str, changes: list, dirty: list) -> list:
+
+    paths = {path for status, old_path, new_path in changes for path in (old_path, new_path) if path is not None}
+    changes = list(changes)
+    for path in dirty:
+        if path in paths:
+            continue
+        if os.path.isfile(os.path.join(dir_root, *path.split('/'))):
+            changes.append((GIT_MODIFIED, path, path))
         else:
-            dirs.append(path)
-
-    files.sort(key=str.lower)
-    for file in files:
-        full_path_file = os.path.join(dir_root, file)
-        if fp is not None:
-            fp.write('%5d %s\n' % (write_excel.get_count(), full_path_file))
-        base, ext = os.path.splitext(file)
-        write_excel.write_cell(CELL_COL_NO, write_excel.get_count(), None, None, NUMBER_FORMAT)
-        write_excel.write_cell(CELL_COL_PATH, dir_relative, ALIGN_LEFT_NO_WRAP, None, None)
-        write_excel.write_cell(CELL_COL_FILE, file, ALIGN_LEFT_NO_WRAP, None, None)
-        write_excel.write_cell(CELL_COL_EXT, ext, ALIGN_CENTER, None, None)
-        # Ignore Files
-        if (base.startswith('.') and ext == '') or ext in IGNORE_EXTENDS:
-            lines = None
-            steps = None
-        elif ext == '.py':
-            lines, steps, msg = scan_python_file(full_path_file, fp)
-        elif ext in ('.java', '.c', '.cpp'):
-            lines, steps, msg = scan_java_file(full_path_file, fp)
-        elif ext == '.sql':
-            lines, steps, msg = scan_sql_file(full_path_file, fp)
-        elif ext == '.txt':
-            lines, steps, msg = scan_text_file(full_path_file)
-        # Other Files
+            changes.append((GIT_DELETED, path, None))
+    return changes
+
+
+# Seek Git Changes
+# Scans the changed files only, and writes the rows of the baseline updated with them in the order of
+# walk_directories(). A changed file which is ignored now drops out of the rows. Returns the deltas.
+def seek_git_changes(writers: list, dir_root: str, dir_relative: str, fp: WriteDebug,
+                     files: dict, changes: list, ignore_rules: IgnoreRules = None) -> list:
+
+    files = dict(files)
+    deltas = []
+    for status, old_path, new_path in changes:
+
+        if new_path is not None and ignore_rules is not None and ignore_rules.is_ignored_path(dir_root, new_path):
+            new_path = None
+        old = files.pop(old_path, None) if old_path is not None else None
+        # The baseline of a dirty tree already has the new path (e.g. renamed or added before it was saved).
+        is_same_path = old_path == new_path
+        if old is None and new_path in files:
+            old = files[new_path]
+            is_same_path = True
+        if old is None and new_path is None:
+            continue
+        if old is None:
+            old = [None, None, None, None]
+        new = [None, None, None, None]
+
+        if new_path is not None:
+            full_path_file = os.path.join(dir_root, *new_path.split('/'))
+            if not os.path.isfile(full_path_file):
+                continue
+            path = os.path.join(dir_relative, *new_path.split('/')[:-1])
+            file = new_path.split('/')[-1]
+            if fp is not None and fp.is_target(path, file):
+                fp.write('%5s %s\n' % (status, full_path_file))
+                result = scan_file(full_path_file, file, fp)
+            else:
+                result = scan_file(full_path_file, file, None)
+            new = files[new_path] = [result.lines, result.steps, result.enc,
+                                     list(result.metrics) if result.metrics is not None else None]
+            if is_same_path and new == old:
+                continue
         else:
-            lines, steps, msg = scan_text_file(full_path_file)
-        write_excel.write_cell(CELL_COL_LINES, lines, None, None, NUMBER_FORMAT)
-        write_excel.write_cell(CELL_COL_STEPS, steps, None, None, NUMBER_FORMAT)
-        print('%5d %s %s %s %s %s' %
-              (write_excel.get_count(), dir_relative, file, ext,
-               lines if lines is not None else '-', steps if steps is not None else '-'))
-        write_excel.next_row()
-
-    dirs.sort(key=str.lower)
-    for dir_nest in dirs:
-        seek_directories(write_excel, level + 1,
-                         os.path.join(dir_root, dir_nest), os.path.join(dir_relative, dir_nest), fp)
+            path = os.path.join(dir_relative, *old_path.split('/')[:-1])
+            file = old_path.split('/')[-1]
+
+        deltas.append((status, path, file, old_path if status == GIT_RENAMED else None,
+                       old[0], new[0], old[1], new[1]))
+
+    results = []
+    for no, git_path in enumerate(sorted(files, key=get_git_order), 1):
+        lines, steps, enc, metrics = files[git_path]
+        parts = git_path.split('/')
+        results.append(FileResult(lines, steps, None, enc, tuple(metrics) if metrics is not None else None).set_row(
+            no, os.path.join(dir_relative, *parts[:-1]), parts[-1]))
+    write_results(writers, results)
+
+    return deltas
+
+
+# Compare Python Engines
+# Prints the Python files whose steps by the tokenize engine differ from ENGINE_OF_PYTHON.
+def compare_python_engines(roots: list, ignore_rules: IgnoreRules = None) -> None:
+
+    num_files, num_diffs, num_errors = 0, 0, 0
+    steps_legacy, steps_tokenize = 0, 0
+    for dir_root, dir_relative in roots:
+        for dir_rel, file, entry in walk_directories(dir_root, dir_relative, ignore_rules):
+
+            if get_scanner_type(file) not in (SCANNER_PYTHON, SCANNER_PYTHON_TOKENIZE):
+                continue
+            str_lines, enc = read_source(entry.path)
+            if str_lines is None:
+                continue
+
+            num_files += 1
+            lines, steps, metrics = ENGINE_OF_PYTHON.count(str_lines)
+            counts = ENGINE_OF_PYTHON_TOKENIZE.count_kinds(str_lines)
+            steps_legacy += steps
+            if counts is None:
+                num_errors += 1
+                steps_tokenize += steps
+                print('%s %s lines %d, tokenize error' % (dir_rel, file, lines))
+                continue
+            steps_new = counts[LINE_CODE] + counts[LINE_MIXED]
+            steps_tokenize += steps_new
+            if steps_new != steps:
+                num_diffs += 1
+                print('%s %s lines %d, steps %d -> %d (%+d), comment %d, docstring %d, blank %d' %
+                      (dir_rel, file, lines, steps, steps_new, steps_new - steps,
+                       counts[LINE_COMMENT], counts[LINE_DOCSTRING], counts[LINE_BLANK]))
+
+    print('compare %d files, %d differ, %d tokenize errors, steps %d -> %d (%+d)' %
+          (num_files, num_diffs, num_errors, steps_legacy, steps_tokenize, steps_tokenize - steps_legacy))
+    return
+
+
+# Print Deltas
+def print_deltas(deltas: list) -> None:
+
+    for status, path, file, renamed, old_lines, new_lines, old_steps, new_steps in deltas:
+        print('%s %s %s lines %+d, steps %+d' %
+              (status, path, file, get_diff(old_lines, new_lines), get_diff(old_steps, new_steps)))
+    print('delta %d files, lines %+d, steps %+d' %
+          (len(deltas), sum(get_diff(delta[4], delta[5]) for delta in deltas),
+           sum(get_diff(delta[6], delta[7]) for delta in deltas)))
+    return
+
+
+# Seek Directories
+# The files flow through a pipeline: a walker thread, reader threads, the scanner (this process, or a process
+# pool with jobs > 1), and the writers in file order. At most PIPELINE_DEPTH files are in flight.
+# Rows are numbered from no_offset + 1. Returns the number of the last row and the duplicate groups.
+def seek_directories(writers: list, dir_root: str, dir_relative: str, fp: WriteDebug,
+                     jobs: int = JOBS_DEFAULT, scan_cache: ScanCache = None, profiler: Profiler = None,
+                     is_dedup: bool = False, readers: int = PIPELINE_READERS_DEFAULT,
+                     no_offset: int = 0, ignore_rules: IgnoreRules = None) -> (int, list):
+
+    # Walk (the whole tree first for duplicate files, which are found by size)
+    if is_dedup:
+        times = get_times() if profiler is not None else None
+        files_all = list(walk_directories(dir_root, dir_relative, ignore_rules))
+        if profiler is not None:
+            profiler.add(PHASE_WALK, times)
+        times = get_times() if profiler is not None else None
+        digests, firsts = find_duplicates(files_all)
+        if profiler is not None:
+            profiler.add(PHASE_DEDUP, times)
+        walker = files_all
+    else:
+        digests, firsts = {}, {}
+        walker = walk_in_thread(dir_root, dir_relative, profiler, ignore_rules)
+
+    # Results of the first copies, and rows of the duplicate groups
+    results_firsts = {first: None for first in firsts.values()}
+    groups = {first: [] for first in results_firsts}
+
+    window = collections.deque()
+    pending = []
+    rows = []
+    num_files = 0
+
+    # Hand the pending files to a reader thread as one batch.
+    def submit() -> None:
+        future = reader_pool.submit(read_files_job, [(item[3], item[2], item[4]) for item in pending],
+                                    profiler is not None, scan_cache is not None, executor)
+        for i, item in enumerate(pending):
+            item[6] = (future, i)
+        pending.clear()
+        return
+
+    def sink(item: list) -> None:
+        no, dir_relative, file, full_path_file, is_debug, result, future = item
+        if is_debug:
+            fp.write('%5d %s\n' % (no_offset + no, full_path_file))
+        if result is None and future is None:
+            # Duplicate of a file written before
+            result = copy.copy(results_firsts[firsts[no]])
+            if scan_cache is not None:
+                scan_cache.put(full_path_file, get_scanner_type(file), result, digests.get(no))
+        elif result is None:
+            if future == ():
+                submit()
+            future, i = item[6]
+            reads, scanned = future.result()
+            digest, data, profile = reads[i]
+            if scanned is None:
+                result = scan_file(full_path_file, file, fp if is_debug else None, profile, data)
+            else:
+                result, debug = scanned.result()[i]
+                if is_debug:
+                    fp.write(debug)
+            if profiler is not None:
+                profiler.add_file(no_offset + no, full_path_file, result.profile)
+            if scan_cache is not None:
+                scan_cache.put(full_path_file, get_scanner_type(file), result, digest or digests.get(no))
+        result.set_row(no_offset + no, dir_relative, file)
+        if no in results_firsts:
+            results_firsts[no] = result
+        first = firsts.get(no, no)
+        if first in groups:
+            groups[first].append(result)
+        rows.append(result)
+        if len(rows) >= PIPELINE_BATCH:
+            write_results(writers, rows, profiler)
+            rows.clear()
+        return
 
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=set_extensions,
+                                   initargs=(EXTENSIONS, IGNORE_EXTENDS,
+                                             [engine.rules for engine in ENGINES.values()
+                                              if engine.rules is not None])) if jobs > 1 else None
+    try:
+        with ThreadPoolExecutor(max_workers=readers) as reader_pool:
+            for no, (dir_relative, file, entry) in enumerate(walker, 1):
+
+                num_files = no
+                full_path_file = entry.path
+                is_debug = fp is not None and fp.is_target(dir_relative, file)
+
+                # Ignored, Cached, and Duplicate Files are not read (the debug file needs a real scan of its files)
+                result = None
+                if is_ignore_file(file):
+                    result = FileResult(None, None, MSG_IGNORE, None)
+                elif scan_cache is not None and not is_debug:
+                    times = get_times() if profiler is not None else None
+                    result = scan_cache.get(full_path_file, get_scanner_type(file), entry.stat())
+                    if profiler is not None:
+                        profiler.add(PHASE_CACHE, times)
+                # A duplicate reuses the result of its first copy, which is written before it.
+                item = [no, dir_relative, file, full_path_file, is_debug, result, None]
+                if result is None and (no not in firsts or is_debug):
+                    item[6] = ()
+                    pending.append(item)
+                    if len(pending) >= PIPELINE_BATCH:
+                        submit()
+                window.append(item)
+
+                # Backpressure
+                while len(window) > PIPELINE_DEPTH:
+                    sink(window.popleft())
+
+            while window:
+                sink(window.popleft())
+            write_results(writers, rows, profiler)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return no_offset + num_files, [group for first, group in sorted(groups.items())]
+
+
+# Initialize Worker Process of Watch Mode (Ctrl+C stops the parent process, which shuts down the workers)
+def init_watch_worker(extensions: dict, ignore_extends: list, rules: list) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    set_extensions(extensions, ignore_extends, rules)
     return
 
 
+# Watch Directories
+# Polls the source folders every interval, and scans only the files whose size or modified time differ from
+# the results in memory. After each change, open_writers() gives new outputs (and the summary, or None),
+# and all rows are written to them again.
+def watch_directories(roots: list, open_writers, ignore_rules: IgnoreRules = None,
+                      interval: float = WATCH_INTERVAL_DEFAULT, jobs: int = JOBS_DEFAULT) -> None:
+
+    results = {}
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_watch_worker,
+                                   initargs=(EXTENSIONS, IGNORE_EXTENDS,
+                                             [engine.rules for engine in ENGINES.values()
+                                              if engine.rules is not None])) if jobs > 1 else None
+    try:
+        is_first = True
+        while True:
+
+            start = time.perf_counter()
+
+            # Poll
+            rows = []
+            touched = []
+            for dir_root, dir_relative in roots:
+                for dir_rel, file, entry in walk_directories(dir_root, dir_relative, ignore_rules):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    key = (stat.st_size, stat.st_mtime_ns)
+                    result = results.get(entry.path)
+                    if result is None or result[0] != key:
+                        result = [key, FileResult(None, None, None, None)]
+                        touched.append((entry.path, file, result))
+                    rows.append((dir_rel, file, entry.path, result))
+            results_polled = {full_path_file: result for dir_rel, file, full_path_file, result in rows}
+            num_removed = len(results.keys() - results_polled.keys())
+            results = results_polled
+
+            # Scan the touched files (a file which fails keeps its error until its size or modified time changes)
+            jobs_scan = [(full_path_file, file) for full_path_file, file, result in touched]
+            if executor is not None:
+                batches = [jobs_scan[i:i + PIPELINE_BATCH] for i in range(0, len(jobs_scan), PIPELINE_BATCH)]
+                scanned = [item for batch in executor.map(scan_watch_files_job, batches) for item in batch]
+            else:
+                scanned = scan_watch_files_job(jobs_scan)
+            for (full_path_file, file, result), item in zip(touched, scanned):
+                result[1] = item
+
+            # Write
+            if is_first or touched or num_removed > 0:
+                try:
+                    writers, summary = open_writers()
+                    results_rows = [result[1].set_row(no, dir_rel, file)
+                                    for no, (dir_rel, file, full_path_file, result) in enumerate(rows, 1)]
+                    for writer in writers:
+                        writer.write_rows(results_rows)
+                    if summary is not None:
+                        for writer in writers:
+                            writer.write_summary(summary)
+                    for writer in writers:
+                        writer.close()
+                except OSError as e:
+                    # e.g. the Excel file is open in Excel, then it is written after the next change
+                    if is_first:
+                        raise
+                    print('output error: %s' % e)
+                for full_path_file, file, result in touched if not is_first else []:
+                    print('      %s %s %s' % (full_path_file,
+                                              result[1].lines if result[1].lines is not None else '-',
+                                              result[1].steps if result[1].steps is not None else '-'))
+                print('[%s] scanned %d, removed %d, total files %d, lines %d, steps %d (%.3f s)' %
+                      (get_current_time(), len(touched), num_removed if not is_first else 0, len(rows),
+                       sum(result[1].lines or 0 for dir_rel, file, full_path_file, result in rows),
+                       sum(result[1].steps or 0 for dir_rel, file, full_path_file, result in rows),
+                       time.perf_counter() - start))
+                sys.stdout.flush()
+            is_first = False
+
+            time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return
+
+
+# Get Root Labels (relative paths of the source folders shown in the path column)
+# Each label is the name of the folder, with as many parent folders as needed to tell apart the folders of the
+# same name, e.g. /a/src and /b/src. The same folder given twice has the same label as itself.
+def get_root_labels(dir_roots: list) -> list:
+
+    parts = [[part for part in os.path.normpath(os.path.abspath(dir_root)).split(os.sep) if part != '']
+             for dir_root in dir_roots]
+    depths = [1] * len(parts)
+    while True:
+        labels = [os.sep + os.sep.join(part[-depth:]) for part, depth in zip(parts, depths)]
+        counts = collections.Counter(labels)
+        collided = [i for i, label in enumerate(labels) if counts[label] > 1 and depths[i] < len(parts[i])]
+        if not collided:
+            return labels
+        for i in collided:
+            depths[i] += 1
+
+
+# Split List (separated by commas or new lines)
+def split_list(text: str) -> list:
+    return [item.strip() for item in re.split(r'[,\n]', text) if item.strip() != '']
+
+
+# Read Config File
+def read_config(in_config: str) -> dict:
+
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    if not parser.read(in_config, encoding='utf-8'):
+        raise OSError('cannot read config file %s' % in_config)
+
+    config = {}
+    if parser.has_section(CONFIG_SECTION):
+        section = parser[CONFIG_SECTION]
+        for key in ('input', 'output', 'ignore', 'exclude'):
+            if key in section:
+                config[key] = split_list(section[key])
+        for key in ('output_dir', 'template'):
+            if key in section:
+                config[key] = section[key].strip()
+        if 'gitignore' in section:
+            config['gitignore'] = section.getboolean('gitignore')
+    if parser.has_section(CONFIG_SECTION_EXTENSIONS):
+        config['extensions'] = [(ext, scanner.strip()) for ext, scanner in parser[CONFIG_SECTION_EXTENSIONS].items()]
+    return config
+
+
 # Get Current Time
 def get_current_time() -> str:
 
@@ -977,29 +2918,288 @@ def get_current_time() -> str:
 def main() -> None:
 
     try:
-        options, arguments = getopt.getopt(sys.argv[1:], shortopts="h", longopts=["help"])
+        options, arguments = getopt.getopt(sys.argv[1:], shortopts="hf:i:x:j:r:cuso:dpgw",
+                                           longopts=["help", "config=", "input=", "output-dir=", "template=",
+                                                     "map=", "ignore=", "exclude=", "gitignore",
+                                                     "jobs=", "readers=", "cache", "dedup", "summary",
+                                                     "output=", "debug-tokens", "debug-files=",
+                                                     "profile", "profile-top=", "profile-stats",
+                                                     "save-baseline", "git", "git-base=",
+                                                     "watch", "watch-interval=", "compare-python"])
     except getopt.error as message:
         print(message)
         print(__doc__)
         sys.exit(1)
 
+    # Config File (the other options override it)
+    config = {}
+    for option, argument in options:
+        if option in ("-f", "--config"):
+            try:
+                config = read_config(argument)
+            except (OSError, configparser.Error) as e:
+                print('config file error: %s' % e)
+                sys.exit(1)
+
+    inputs = config.get('input', [])
+    inputs_option = []
+    out_dir = config.get('output_dir')
+    in_excel = config.get('template', IN_EXCEL)
+    mappings = config.get('extensions', [])
+    ignore_extends = IGNORE_EXTENDS + config.get('ignore', [])
+    excludes = config.get('exclude', [])
+    is_gitignore = config.get('gitignore', False)
+    jobs = JOBS_DEFAULT
+    readers = PIPELINE_READERS_DEFAULT
+    is_cache = False
+    is_dedup = False
+    is_summary = False
+    formats = config.get('output', FORMATS_DEFAULT)
+    is_debug = False
+    debug_patterns = []
+    is_profile = False
+    profile_top = PROFILE_TOP_DEFAULT
+    is_profile_stats = False
+    is_save_baseline = False
+    is_git = False
+    git_base = None
+    is_watch = False
+    watch_interval = WATCH_INTERVAL_DEFAULT
+    is_compare = False
     for option, argument in options:
         if option in ("-h", "--help"):
             print(__doc__)
             sys.exit(0)
+        elif option in ("-i", "--input"):
+            inputs_option.append(argument)
+        elif option == "--output-dir":
+            out_dir = argument
+        elif option == "--template":
+            in_excel = argument
+        elif option == "--map":
+            for mapping in split_list(argument):
+                ext, sep, scanner = mapping.partition(':')
+                if sep == '':
+                    print('option %s requires EXT:SCANNER, not %s' % (option, mapping))
+                    print(__doc__)
+                    sys.exit(1)
+                mappings.append((ext.strip(), scanner.strip()))
+        elif option == "--ignore":
+            ignore_extends = ignore_extends + split_list(argument)
+        elif option in ("-x", "--exclude"):
+            excludes = excludes + split_list(argument)
+        elif option == "--gitignore":
+            is_gitignore = True
+        elif option in ("-j", "--jobs"):
+            if not argument.isdigit():
+                print('option %s requires a number' % option)
+                print(__doc__)
+                sys.exit(1)
+            jobs = int(argument) if int(argument) > 0 else os.cpu_count()
+        elif option in ("-r", "--readers"):
+            if not argument.isdigit() or int(argument) < 1:
+                print('option %s requires a number of 1 or more' % option)
+                print(__doc__)
+                sys.exit(1)
+            readers = int(argument)
+        elif option in ("-c", "--cache"):
+            is_cache = True
+        elif option in ("-u", "--dedup"):
+            is_dedup = True
+        elif option in ("-s", "--summary"):
+            is_summary = True
+        elif option in ("-o", "--output"):
+            formats = split_list(argument)
+        elif option in ("-d", "--debug-tokens"):
+            is_debug = True
+        elif option == "--debug-files":
+            is_debug = True
+            debug_patterns += split_list(argument)
+        elif option in ("-p", "--profile"):
+            is_profile = True
+        elif option == "--profile-top":
+            if not argument.isdigit():
+                print('option %s requires a number' % option)
+                print(__doc__)
+                sys.exit(1)
+            is_profile = True
+            profile_top = int(argument)
+        elif option == "--profile-stats":
+            is_profile = True
+            is_profile_stats = True
+        elif option == "--save-baseline":
+            is_save_baseline = True
+        elif option in ("-g", "--git"):
+            is_git = True
+        elif option == "--git-base":
+            is_git = True
+            git_base = argument
+        elif option in ("-w", "--watch"):
+            is_watch = True
+        elif option == "--compare-python":
+            is_compare = True
+        elif option == "--watch-interval":
+            try:
+                watch_interval = float(argument)
+            except ValueError:
+                watch_interval = -1.0
+            if watch_interval <= 0.0:
+                print('option %s requires a number of seconds' % option)
+                print(__doc__)
+                sys.exit(1)
+            is_watch = True
+
+    if inputs_option:
+        inputs = inputs_option
+    for fmt in formats:
+        if fmt not in FORMATS:
+            print('unknown output format %s' % fmt)
+            print(__doc__)
+            sys.exit(1)
 
-    print('Source Code Counter - start [%s]' % get_current_time())
+    # Extensions (with or without the leading '.')
+    extensions = dict(EXTENSIONS)
+    for ext, scanner in mappings:
+        if scanner not in SCANNERS:
+            print('unknown scanner %s for %s' % (scanner, ext))
+            print(__doc__)
+            sys.exit(1)
+        extensions[ext if ext.startswith('.') else '.' + ext] = scanner
+    ignore_extends = [ext if ext.startswith('.') else '.' + ext for ext in ignore_extends]
+    set_extensions(extensions, ignore_extends)
+    ignore_rules = IgnoreRules(excludes, is_gitignore) if excludes or is_gitignore else None
+
+    # Source Folders, each (root, relative path shown in the path column)
+    if inputs:
+        roots = list(zip(inputs, get_root_labels(inputs)))
+        for dir_relative, count in collections.Counter(label for dir_root, label in roots).items():
+            if count > 1:
+                print('source folder given more than once: %s' % dir_relative)
+                sys.exit(1)
+    else:
+        roots = [(IN_SRC_ROOT + IN_SRC_RELATIVE, IN_SRC_RELATIVE)]
+    for dir_root, dir_relative in roots:
+        if not os.path.isdir(dir_root):
+            print('source folder not found: %s' % dir_root)
+            sys.exit(1)
+    if (is_git or is_save_baseline) and len(roots) > 1:
+        print('the git mode and --save-baseline allow only one source folder')
+        sys.exit(1)
+    if is_watch and (is_git or is_save_baseline):
+        print('the watch mode cannot be used with the git mode and --save-baseline')
+        sys.exit(1)
 
-    # fp = None
-    fp = open(OUT_DEBUG, 'w', encoding='utf-8')
-    write_excel = WriteExcel(IN_EXCEL, OUT_EXCEL, OUT_SHEET)
+    # Output Files
+    def get_out_path(path: str) -> str:
+        return os.path.join(out_dir, os.path.basename(path)) if out_dir is not None else path
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    # Git Mode
+    baseline, changes = None, None
+    if is_git:
+        dir_root, dir_relative = roots[0]
+        try:
+            baseline = read_baseline(get_out_path(OUT_BASELINE))
+            git_base = git_base if git_base is not None else baseline['revision']
+            if git_base is None:
+                raise ValueError('no git revision in the baseline')
+            changes = add_git_dirty(dir_root, get_git_changes(dir_root, git_base), baseline.get('dirty', []))
+        except (OSError, ValueError, RuntimeError) as e:
+            print('git mode error: %s' % e)
+            sys.exit(1)
 
-    seek_directories(write_excel, 0, IN_SRC_ROOT + IN_SRC_RELATIVE, IN_SRC_RELATIVE, fp)
+    print('Source Code Counter - start [%s]' % get_current_time())
 
-    write_excel.close()
+    # Outputs (the summary is also one of them)
+    def open_writers() -> (list, WriteSummary):
+        writers_opened = []
+        for fmt in formats:
+            if fmt == FORMAT_EXCEL:
+                writers_opened.append(WriteExcel(in_excel, get_out_path(OUT_EXCEL), OUT_SHEET))
+            elif fmt == FORMAT_CSV:
+                writers_opened.append(WriteCsv(get_out_path(OUT_CSV)))
+            elif fmt == FORMAT_JSONL:
+                writers_opened.append(WriteJsonLines(get_out_path(OUT_JSONL)))
+            elif fmt == FORMAT_COLUMNAR:
+                writers_opened.append(WriteColumnar(get_out_path(OUT_COLUMNAR)))
+        summary_opened = WriteSummary() if is_summary else None
+        if summary_opened is not None:
+            writers_opened.append(summary_opened)
+        return writers_opened, summary_opened
+
+    # Compare Mode
+    if is_compare:
+        compare_python_engines(roots, ignore_rules)
+        print('Source Code Counter - end [%s]' % get_current_time())
+        sys.exit(0)
+
+    # Watch Mode
+    if is_watch:
+        try:
+            watch_directories(roots, open_writers, ignore_rules, watch_interval, jobs)
+        except KeyboardInterrupt:
+            pass
+        print('Source Code Counter - end [%s]' % get_current_time())
+        sys.exit(0)
+
+    profiler = Profiler(profile_top) if is_profile else None
+    stats = cProfile.Profile() if is_profile_stats else None
+    if stats is not None:
+        stats.enable()
+
+    fp = WriteDebug(get_out_path(OUT_DEBUG), debug_patterns) if is_debug else None
+    writers, summary = open_writers()
+    if is_save_baseline or is_git:
+        dir_root, dir_relative = roots[0]
+        writers.append(WriteBaseline(get_out_path(OUT_BASELINE), dir_relative, get_git_revision(dir_root),
+                                     get_git_dirty(dir_root)))
+    scan_cache = ScanCache(get_out_path(OUT_CACHE)) if is_cache and not is_git else None
+
+    if is_git:
+        dir_root, dir_relative = roots[0]
+        deltas = seek_git_changes(writers, dir_root, dir_relative, fp, baseline['files'], changes, ignore_rules)
+        for writer in writers:
+            writer.write_delta(deltas)
+        print_deltas(deltas)
+    else:
+        no, groups = 0, []
+        for dir_root, dir_relative in roots:
+            no, groups_root = seek_directories(writers, dir_root, dir_relative, fp, jobs, scan_cache, profiler,
+                                               is_dedup, readers, no, ignore_rules)
+            groups += groups_root
+        if is_dedup:
+            for writer in writers:
+                writer.write_duplicates(groups)
+            print_duplicates(groups)
+
+    if summary is not None:
+        for writer in writers:
+            writer.write_summary(summary)
+    for writer in writers:
+        times = get_times() if profiler is not None else None
+        writer.close()
+        if profiler is not None:
+            profiler.add(PHASE_WRITE + type(writer).__name__, times)
+    if scan_cache is not None:
+        print('cache hits %d, misses %d' % scan_cache.get_count())
+        scan_cache.close()
     if fp is not None:
         fp.close()
 
+    if stats is not None:
+        stats.disable()
+        stats.dump_stats(get_out_path(OUT_PROFILE_STATS))
+    if profiler is not None:
+        report = profiler.report()
+        report['jobs'] = jobs
+        with open(get_out_path(OUT_PROFILE), 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print('profile (wall / cpu seconds):')
+        for phase, value in report['phases'].items():
+            print('  %-24s %10.3f %10.3f' % (phase, value['wall'], value['cpu']))
+        print('  %-24s %10.3f %10.3f' % ('total', report['total']['wall'], report['total']['cpu']))
+
     print('Source Code Counter - end [%s]' % get_current_time())
 
     sys.exit(0)
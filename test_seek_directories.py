@@ -66,6 +66,28 @@ def seek_directories(level: int, dir_root: str, dir_relative: str) -> None:
     return
 
 
+# os.scandir() (Iterative)
+def os_scandir() -> None:
+    stack = [('.\\input\\src', '.\\src')]
+    while stack:
+        dir_root, dir_relative = stack.pop()
+        dirs = []
+        files = []
+        with os.scandir(dir_root) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    files.append(entry)
+                elif entry.is_dir():
+                    dirs.append(entry)
+        files.sort(key=lambda e: e.name.lower())
+        for entry in files:
+            print(entry.path)
+        dirs.sort(key=lambda e: e.name.lower(), reverse=True)
+        for entry in dirs:
+            stack.append((entry.path, os.path.join(dir_relative, entry.name)))
+    return
+
+
 # Main
 def main() -> None:
 
@@ -81,6 +103,9 @@ def main() -> None:
     print('-- os.listdir() の再帰呼出し -- ルートフォルダーファイル、子フォルダー、子フォルダーのファイル、...')
     seek_directories(0, '.\\input\\src', '.\\src')
 
+    print('-- os.scandir() の反復 -- ルートフォルダーファイル、子フォルダーのファイル、...（os.listdir() の再帰呼出しと同じ順序）')
+    os_scandir()
+
     sys.exit(0)
 
 